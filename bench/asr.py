@@ -0,0 +1,142 @@
+"""
+Accuracy and speed comparison of the ASR backends in src/asr.py.
+
+Transcribes a fixed set of generated audios with every configuration and
+reports the word error rate against the text that was synthesized (from the
+timings sidecars of the audio stage, or a .txt file next to each MP3) and the
+real-time factor, i.e. seconds of compute per second of audio.
+
+Usage:
+    python -m bench.asr --limit 20
+    python -m bench.asr --configs whisper:small.en faster-whisper:small.en:int8 faster-whisper:base.en:int8 --language en
+"""
+import argparse
+import glob
+import json
+import os
+import re
+import sys
+import time
+
+_WORDS_PATTERN = re.compile(r"[a-z0-9']+")
+
+def words(text):
+    """Lowercase words without punctuation, the unit of the word error rate."""
+    return _WORDS_PATTERN.findall(text.lower())
+
+def word_errors(reference, hypothesis):
+    """
+    Returns:
+        int: The number of substituted, deleted and inserted words (Levenshtein distance over words).
+    """
+    previous = list(range(len(hypothesis) + 1))
+    for i, ref_word in enumerate(reference, start=1):
+        current = [i]
+        for j, hyp_word in enumerate(hypothesis, start=1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_word != hyp_word)))
+        previous = current
+    return previous[-1]
+
+def audio_set(directory, limit):
+    """
+    Returns:
+        list: (path, reference text, duration) of the audios with a known text, sorted so the set is fixed.
+    """
+    from utils import mp3, subtitles
+
+    items = []
+    for path in sorted(glob.glob(os.path.join(directory, '*.mp3'))):
+        stem = path[:-len('.mp3')]
+        if os.path.isfile(f'{stem}.chunks.json'):
+            reference = ' '.join(text for text, _ in subtitles.load_timings(f'{stem}.chunks.json'))
+        elif os.path.isfile(f'{stem}.txt'):
+            with open(f'{stem}.txt') as file:
+                reference = file.read()
+        else:
+            continue
+        with open(path, 'rb') as file:
+            duration = mp3.MP3Frames(file.read()).duration
+        items.append((path, reference, duration))
+        if limit and len(items) >= limit:
+            break
+    return items
+
+def parse_config(config):
+    """'backend[:model[:compute_type]]' -> backend name and options."""
+    name, *rest = config.split(':')
+    options = {}
+    if rest:
+        options['model_name'] = rest[0]
+    if len(rest) > 1:
+        options['compute_type'] = rest[1]
+    return name, options
+
+def run(name, options, items):
+    from src.asr import get_backend
+
+    backend = get_backend(name, **options)
+    start = time.perf_counter()
+    backend.load()
+    load_seconds = time.perf_counter() - start
+
+    errors = reference_words = 0
+    compute = audio = 0.0
+    for path, reference, duration in items:
+        start = time.perf_counter()
+        result = backend.transcribe(path)
+        compute += time.perf_counter() - start
+        audio += duration
+        reference = words(reference)
+        errors += word_errors(reference, words(result['text']))
+        reference_words += len(reference)
+
+    return {
+        'load_seconds': load_seconds,
+        'wer': errors / reference_words if reference_words else 0.0,
+        'rtf': compute / audio if audio else 0.0,
+        'seconds': compute,
+    }
+
+def main():
+    from config.structure import AUDIO_DIR
+    from src.asr import available_backends
+
+    parser = argparse.ArgumentParser(description='Compare accuracy and speed of the ASR backends')
+    parser.add_argument('--audio-dir', default=AUDIO_DIR, help='Directory of generated audios with timings sidecars or .txt transcripts')
+    parser.add_argument('--limit', type=int, default=20, help='Number of audios to transcribe; 0 for all')
+    parser.add_argument('--configs', nargs='+', default=['whisper:small.en', 'faster-whisper:small.en:int8'], help='Configurations as backend[:model[:compute_type]]; the first is the baseline')
+    parser.add_argument('--beam-size', type=int, help='Beam search width of all configurations')
+    parser.add_argument('--language', help='Pin the language of all configurations, e.g. en')
+    parser.add_argument('--vad', action='store_true', help="Use faster-whisper's voice activity detection")
+    parser.add_argument('--threads', type=int, help='Inference threads of all configurations')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    args = parser.parse_args()
+
+    items = audio_set(args.audio_dir, args.limit)
+    if not items:
+        print(f"No audios with a known text in {args.audio_dir}, run the audio stage first", file=sys.stderr)
+        sys.exit(1)
+    total = sum(duration for _, _, duration in items)
+    print(f"{len(items)} audios, {total:.0f} seconds")
+
+    installed = available_backends()
+    results = {}
+    baseline = None
+    print(f"{'configuration':<36} {'load s':>7} {'WER':>7} {'RTF':>7} {'speedup':>8}")
+    for config in args.configs:
+        name, options = parse_config(config)
+        if name not in installed:
+            print(f"{config:<36} not installed, skipped", file=sys.stderr)
+            continue
+        options.update({'beam_size': args.beam_size, 'language': args.language, 'vad': args.vad, 'threads': args.threads})
+        result = results[config] = run(name, options, items)
+        baseline = baseline or result['rtf']
+        speedup = baseline / result['rtf'] if result['rtf'] else 0.0
+        print(f"{config:<36} {result['load_seconds']:>7.1f} {result['wer']:>7.2%} {result['rtf']:>7.3f} {speedup:>7.1f}x")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({'audios': len(items), 'audio_seconds': total, 'results': results}, file, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+"""
+Local stand-ins for the services vidgen talks to, so the pipeline can be
+benchmarked offline: a Reddit fixture server, a fake TikTok TTS server, a fake
+whisper model and synthetic media files.
+"""
+import base64
+import hashlib
+import html
+import json
+import os
+import random
+import subprocess
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = ('the', 'a', 'my', 'friend', 'told', 'me', 'that', 'she', 'never', 'went', 'to', 'work', 'after',
+         'dinner', 'and', 'then', 'we', 'argued', 'about', 'money', 'for', 'hours', 'until', 'sunrise',
+         'because', 'nobody', 'wanted', 'apologize', 'first', 'so', 'I', 'left', 'house', 'quietly')
+
+def make_corpus(size, subreddits, seed=0, content_length=1500):
+    """
+    Generate a deterministic set of fake Reddit posts.
+
+    Args:
+        size (int): The total number of posts.
+        subreddits (iterable): The subreddits to spread the posts across.
+        seed (int): The random seed.
+        content_length (int): The approximate number of characters of each post body.
+
+    Returns:
+        dict: A mapping of subreddit to a list of {'title', 'author', 'content'} dicts.
+    """
+    rng = random.Random(seed)
+    subreddits = list(subreddits)
+    corpus = {subreddit: [] for subreddit in subreddits}
+
+    for i in range(size):
+        sentences = []
+        length = 0
+        while length < content_length:
+            sentence = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(6, 18))).capitalize() + '.'
+            sentences.append(sentence)
+            length += len(sentence) + 1
+        corpus[subreddits[i % len(subreddits)]].append({
+            'title': f"Post {i}: " + ' '.join(rng.choice(WORDS) for _ in range(8)),
+            'author': f"/u/bench_user_{rng.randint(0, 10 ** 6)}",
+            'content': ' '.join(sentences),
+        })
+    return corpus
+
+def render_rss(posts):
+    """Render posts as a Reddit-style Atom feed."""
+    entries = []
+    for post in posts:
+        body = ''.join(f'<p>{html.escape(sentence)}.</p>' for sentence in post['content'].split('. '))
+        entries.append(f"""<entry>
+<author><name>{html.escape(post['author'])}</name></author>
+<content type="html">{html.escape(f'<div class="md">{body}</div>')}</content>
+<title>{html.escape(post['title'])}</title>
+</entry>""")
+    return f'<?xml version="1.0" encoding="UTF-8"?><feed xmlns="http://www.w3.org/2005/Atom">{"".join(entries)}</feed>'
+
+def render_web(posts):
+    """Render posts as a Reddit-style /top HTML page with shreddit-post elements."""
+    items = []
+    for i, post in enumerate(posts):
+        items.append(f"""<shreddit-post id="t3_{i}">
+<a id="post-title-t3_{i}" href="#">{html.escape(post['title'])}</a>
+<span slot="authorName">{html.escape(post['author'])}</span>
+<div id="t3_{i}-post-rtjson-content"><p>{html.escape(post['content'])}</p></div>
+</shreddit-post>""")
+    return f'<html><head><title>top</title></head><body>{"".join(items)}</body></html>'
+
+class _Server:
+    """A ThreadingHTTPServer on a free local port, running in a background thread."""
+    def __init__(self, handler):
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        self.httpd.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.httpd.server_port}'
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+class _QuietHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body, content_type, headers=None):
+        body = body.encode() if isinstance(body, str) else body
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def reddit_server(corpus):
+    """
+    Serve /r/<subreddit>/top.rss and /r/<subreddit>/top from a corpus made by make_corpus().
+
+    Every page has an ETag, and requests with a matching If-None-Match get a 304.
+
+    Returns:
+        _Server: A context manager; its url attribute can be passed to ContentGetter(base_url=...).
+    """
+    pages = {}
+    for subreddit, posts in corpus.items():
+        pages[f'/r/{subreddit}/top.rss'] = (render_rss(posts), 'application/atom+xml')
+        pages[f'/r/{subreddit}/top'] = (render_web(posts), 'text/html')
+
+    class Handler(_QuietHandler):
+        def do_GET(self):
+            page = pages.get(self.path)
+            if page is None:
+                self._send(404, 'not found', 'text/plain')
+                return
+            etag = '"' + hashlib.sha1(page[0].encode()).hexdigest() + '"'
+            if self.headers.get('If-None-Match') == etag:
+                self._send(304, b'', page[1], {'ETag': etag})
+            else:
+                self._send(200, *page, {'ETag': etag})
+
+    return _Server(Handler)
+
+def tts_server(mp3_bytes, latency=0.0, style=0):
+    """
+    Serve the JSON/base64 protocol of the TikTok TTS endpoints in utils/tiktok_tts.py.
+
+    Args:
+        mp3_bytes (bytes): The audio returned for every request.
+        latency (float): Seconds to wait before answering a generation request, to emulate the network.
+        style (int): Which response format to use, matching the index of the endpoint in ENDPOINTS.
+
+    Returns:
+        _Server: A context manager; use f'{server.url}/api/generation' as endpoint.
+    """
+    encoded = base64.b64encode(mp3_bytes).decode()
+    if style == 0:
+        payload = json.dumps({'success': True, 'data': encoded, 'error': None})
+    else:
+        payload = json.dumps({'data': f'data:audio/mpeg;base64,{encoded}'})
+
+    class Handler(_QuietHandler):
+        def do_GET(self):
+            # Availability probe on the endpoint root
+            self._send(200, 'ok', 'text/plain')
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            if latency:
+                time.sleep(latency)
+            self._send(200, payload, 'application/json')
+
+    return _Server(Handler)
+
+class FakeWhisperModel:
+    """
+    Stands in for a whisper model: returns evenly spaced segments without running ASR.
+    """
+    def __init__(self, delay=0.0):
+        self.delay = delay
+
+    def transcribe(self, audio_path, **kwargs):
+        if self.delay:
+            time.sleep(self.delay)
+        segments = [{'id': i, 'start': i * 2.0, 'end': i * 2.0 + 2.0, 'text': f' segment {i}'} for i in range(5)]
+        return {'text': ''.join(s['text'] for s in segments), 'segments': segments, 'language': 'en'}
+
+def make_silence_mp3(path, seconds=1.0):
+    """Create a silent mono MP3 with ffmpeg."""
+    subprocess.run(['ffmpeg', '-loglevel', 'error', '-y', '-f', 'lavfi', '-i', 'anullsrc=r=24000:cl=mono',
+                    '-t', str(seconds), '-c:a', 'libmp3lame', '-b:a', '64k', path], check=True)
+    with open(path, 'rb') as file:
+        return file.read()
+
+def make_background_video(path, seconds=120):
+    """Create a tiny synthetic background video with ffmpeg."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    subprocess.run(['ffmpeg', '-loglevel', 'error', '-y', '-f', 'lavfi', '-i', 'testsrc=size=180x320:rate=15',
+                    '-t', str(seconds), '-c:v', 'libx264', '-preset', 'ultrafast', '-pix_fmt', 'yuv420p', path], check=True)
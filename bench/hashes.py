@@ -0,0 +1,71 @@
+"""
+Regression check of Post hashes against the Post code before TextNormalizer.
+
+Posts are deduplicated by hash, so a re-crawled post must hash exactly as it
+did when it was stored. Checks titles with the corner cases of the old
+normalization (slang inside words, casing, age/gender tags, whitespace) and
+the fixture corpus. Exits with status 1 on a mismatch.
+
+Usage:
+    python -m bench.hashes
+"""
+import argparse
+import hashlib
+import re
+import sys
+
+EDGE_CASE_TITLES = [
+    "I still can't believe it",
+    "Title of utility",
+    "My (24M) GF (23F) said until",
+    "TIL that tilted tiles are a thing",
+    "TIFU by saying TL,DR and tldr",
+    "AITA for being cuz of my ILPT, ULPT and LPT?",
+    "What the f*ck, I f*cked up",
+    "Tabs\tand\nnewlines  and   spaces",
+    "  (99f) leading tag and trailing (1m)",
+    "Straße İstanbul ǅ casing",
+    "",
+]
+
+def legacy_replace_words(text, replacement_dict):
+    """utils.text.replace_words before it was removed, verbatim."""
+    for k, v in replacement_dict.items():
+        text = text.lower().replace(k.lower(), v)
+    return text
+
+def legacy_hash(title, author, subreddit):
+    """The hash of Post.__init__ before TextNormalizer, step for step."""
+    from config.dicts import REDDIT_SLANG
+
+    title = legacy_replace_words(title, REDDIT_SLANG)
+    title = re.sub(r"\(?\d{1,3}[mfMF]\)?", '', title).strip()
+    author = author.replace('\n', ' ').replace('\t', ' ')
+    author = re.sub(' +', ' ', author).strip()
+    title = title.replace('\n', ' ').replace('\t', ' ')
+    title = re.sub(' +', ' ', title).strip()
+    return hashlib.sha256(str.encode(title) + str.encode(author) + str.encode(subreddit)).hexdigest()
+
+def main():
+    from bench import fixtures
+    from config.dicts import SUBREDDITS
+    from models.post import Post
+
+    parser = argparse.ArgumentParser(description='Check that Post hashes match the legacy normalization')
+    parser.add_argument('--size', type=int, default=500, help='Number of fixture posts to check as well')
+    args = parser.parse_args()
+
+    cases = [(title, ' some\tauthor ', 'r/test') for title in EDGE_CASE_TITLES]
+    for subreddit, posts in fixtures.make_corpus(args.size, SUBREDDITS).items():
+        cases += [(post['title'], post['author'], subreddit) for post in posts]
+
+    mismatches = [(title, author) for title, author, subreddit in cases
+                  if Post(title, author, subreddit, '', 0).hash != legacy_hash(title, author, subreddit)]
+    for title, author in mismatches:
+        print(f"MISMATCH: title {title!r}, author {author!r}", file=sys.stderr)
+    print(f"Checked {len(cases)} posts, {len(mismatches)} mismatches")
+    if mismatches:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
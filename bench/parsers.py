@@ -0,0 +1,131 @@
+"""
+Compatibility check and micro-benchmark of the HTML parser backends in utils/html_parser.py.
+
+Every installed backend must extract exactly what the original BeautifulSoup
+code of ContentGetter extracted, from the fixture pages and from any saved
+Reddit pages passed on the command line. Exits with status 1 on a mismatch.
+
+Usage:
+    python -m bench.parsers
+    python -m bench.parsers --web saved_top.html --rss saved_top.rss --repeat 50
+"""
+import argparse
+import sys
+import time
+
+import feedparser
+
+from bs4 import BeautifulSoup
+
+# Pages with the corner cases a backend could get wrong
+EDGE_CASE_WEB = """<html><body>
+<shreddit-post id="t3_a"><a id="post-title-t3_a" href="#">Ampersands &amp; <b>bold</b> &#8212; entities</a>
+<span slot="authorName">/u/someone</span>
+<div id="t3_a-post-rtjson-content"><p>First  paragraph</p>
+<p>Second <em>emphasized</em>&nbsp;line</p><ul><li>list item</li></ul></div></shreddit-post>
+<shreddit-post id="t3_b"><a id="post-title-t3_b">No author</a><div id="t3_b-post-rtjson-content"><p>x</p></div></shreddit-post>
+<shreddit-post><a id="post-title-x">Without id</a><span slot="authorName">/u/anon</span>
+<div id="x-post-rtjson-content">Unicode: café ’quotes’ \U0001f600</div></shreddit-post>
+</body></html>"""
+
+EDGE_CASE_PARAGRAPHS = '<div class="md"><p>One &lt;tag&gt;</p><p>Two <a href="#">link</a></p><pre>not a p</pre><p></p></div>'
+
+def legacy_web_posts(html):
+    """The extraction of ContentGetter.from_web before the parser backends, field for field."""
+    posts = []
+    for post in BeautifulSoup(html, 'html.parser').find_all('shreddit-post'):
+        title = post.find('a', id=lambda x: x and 'post-title' in x)
+        author = post.find('span', {'slot': 'authorName'})
+        content = post.find('div', id=lambda x: x and 'post-rtjson-content' in x)
+        posts.append({
+            'id': post.get('id'),
+            'title': title.text if title else None,
+            'author': author.text if author else None,
+            'content': content.text if content else None,
+        })
+    return posts
+
+def legacy_paragraph_text(html):
+    """The extraction of ContentGetter.from_rss_subreddit before the parser backends."""
+    paragraphs = BeautifulSoup(html, 'html.parser').find_all('p')
+    return ''.join([p.get_text() for p in paragraphs])
+
+def fixture_pages(size):
+    from bench import fixtures
+    from config.dicts import SUBREDDITS
+
+    corpus = fixtures.make_corpus(size, SUBREDDITS)
+    # ContentGetter passes the raw response body
+    web = [fixtures.render_web(posts).encode() for posts in corpus.values()] + [EDGE_CASE_WEB.encode()]
+    rss = [fixtures.render_rss(posts) for posts in corpus.values()]
+    return web, rss
+
+def check(name, fn, reference, inputs):
+    """
+    Returns:
+        list: Descriptions of the inputs where fn and reference disagree.
+    """
+    mismatches = []
+    for i, document in enumerate(inputs):
+        expected, actual = reference(document), fn(document)
+        if expected != actual:
+            mismatches.append(f"{name} input {i}: expected {str(expected)[:200]!r}, got {str(actual)[:200]!r}")
+    return mismatches
+
+def timed(fn, inputs, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for document in inputs:
+            fn(document)
+    return (time.perf_counter() - start) / repeat
+
+def main():
+    from utils.html_parser import PARSERS, available_parsers
+
+    parser = argparse.ArgumentParser(description='Check and time the HTML parser backends')
+    parser.add_argument('--size', type=int, default=200, help='Number of fixture posts')
+    parser.add_argument('--web', nargs='*', default=[], help='Saved Reddit /top pages to check as well')
+    parser.add_argument('--rss', nargs='*', default=[], help='Saved Reddit top.rss feeds to check as well')
+    parser.add_argument('--repeat', type=int, default=10, help='Timing repetitions')
+    args = parser.parse_args()
+
+    web, rss = fixture_pages(args.size)
+    for path in args.web:
+        with open(path, 'rb') as file:
+            web.append(file.read())
+    for path in args.rss:
+        with open(path, 'rb') as file:
+            rss.append(file.read())
+
+    # Like from_rss_subreddit, the backends only see the HTML content of each feed entry
+    fragments = [entry.content[0].value for feed in rss for entry in feedparser.parse(feed).entries]
+    fragments.append(EDGE_CASE_PARAGRAPHS)
+
+    names = available_parsers()
+    missing = [name for name in PARSERS if name not in names]
+    if missing:
+        print(f"Not installed, skipped: {', '.join(missing)}", file=sys.stderr)
+
+    mismatches = []
+    baseline = None
+    print(f"{'backend':<12} {'web s/round':>12} {'rss s/round':>12} {'speedup':>8}")
+    for name in ['legacy'] + names:
+        if name == 'legacy':
+            web_fn, paragraph_fn = legacy_web_posts, legacy_paragraph_text
+        else:
+            backend = PARSERS[name]()
+            web_fn, paragraph_fn = backend.web_posts, backend.paragraph_text
+            mismatches += check(f"{name} web_posts", web_fn, legacy_web_posts, web)
+            mismatches += check(f"{name} paragraph_text", paragraph_fn, legacy_paragraph_text, fragments)
+
+        total = timed(web_fn, web, args.repeat), timed(paragraph_fn, fragments, args.repeat)
+        baseline = baseline or sum(total)
+        print(f"{name:<12} {total[0]:>12.4f} {total[1]:>12.4f} {baseline / sum(total):>7.1f}x")
+
+    for mismatch in mismatches:
+        print(f"MISMATCH: {mismatch}", file=sys.stderr)
+    if mismatches:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+"""
+Offline throughput benchmark for the vidgen pipeline.
+
+Runs the crawl, audio, subtitle and video stages against the local stand-ins
+in bench/fixtures.py for several corpus sizes and reports posts per second for
+each stage and end to end. With --baseline, exits with status 1 if any
+number dropped more than --threshold below the baseline.
+
+Usage:
+    python -m bench.run --sizes 10 100 --save-baseline bench_baseline.json
+    python -m bench.run --sizes 10 100 --baseline bench_baseline.json --threshold 0.2
+
+Requires ffmpeg for the synthetic media. The subtitle stage fakes the
+whisper model, and the video stage encodes with libx264 on the CPU unless
+--video-codec and --hwaccel select the GPU path of src/composer.py.
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from config import structure
+
+STAGES = ('crawl', 'audio', 'subtitles', 'video', 'end_to_end')
+
+def configure_paths(root):
+    """
+    Point all data paths to a scratch directory.
+
+    Must run before any module that imports paths from config.structure is imported.
+    """
+    structure.DB_PATH = os.path.join(root, 'db.sqlite3')
+    structure.AUDIO_DIR = os.path.join(root, 'audio')
+    structure.SUBTITLE_DIR = os.path.join(root, 'subtitles')
+    structure.VIDEO_DIR = os.path.join(root, 'video', 'done')
+    structure.BACKGROUNDS_DIR = os.path.join(root, 'video', 'bg')
+
+def reset_data():
+    """Remove the DB and all generated files from the scratch directory."""
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(structure.DB_PATH + suffix):
+            os.remove(structure.DB_PATH + suffix)
+    for directory in (structure.AUDIO_DIR, structure.SUBTITLE_DIR, structure.VIDEO_DIR):
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+
+def crawl(db, base_url, loglevel):
+    from config.dicts import SUBREDDITS
+    from src.content_getter import ContentGetter
+    from src.dedup import DedupIndex
+
+    cg = ContentGetter(loglevel=loglevel, base_url=base_url)
+    known = DedupIndex.from_db(db, loglevel=loglevel)
+    new_posts = [post for subreddit, posts in cg.crawl(SUBREDDITS) for post in posts if known.add(post.hash)]
+    return db.insert_many(new_posts, ignore_existing=True)
+
+def make_stage(name, generator, db, flag, workers):
+    from src.pipeline import Stage
+
+    def run(post):
+        if generator.from_post(post):
+            db.set_flags(post, **{flag: True})
+            return True
+        return False
+    return Stage(name, run, workers=workers)
+
+def run_size(size, args, urls, loglevel):
+    """
+    Benchmark all selected stages on a fresh DB with a corpus of the given size.
+
+    Returns:
+        dict: A mapping of stage name to posts per second.
+    """
+    from src.db import DB, NEEDS_AUDIO, NEEDS_SUBTITLES, NEEDS_VIDEO
+    from src.pipeline import Pipeline
+    from src.audio_generator import AudioGenerator
+
+    def stage_objects():
+        stages = {'audio': make_stage('Audio', AudioGenerator(loglevel=loglevel), db, 'audio', args.audio_workers)}
+        if 'subtitles' in args.stages or 'end_to_end' in args.stages:
+            from src.subtitler import Subtitler
+            from bench.fixtures import FakeWhisperModel
+            stages['subtitles'] = make_stage('Subtitles', Subtitler(loglevel=loglevel, model=FakeWhisperModel(args.asr_delay), mode=args.subtitle_mode), db, 'subtitles', 1)
+        if 'video' in args.stages or 'end_to_end' in args.stages:
+            from src.composer import Composer
+            stages['video'] = make_stage('Video', Composer(loglevel=loglevel, hwaccel=args.hwaccel, video_codec=args.video_codec), db, 'video', args.video_workers)
+        return stages
+
+    results = {}
+
+    def timed(name, fn):
+        start = time.perf_counter()
+        count = fn()
+        elapsed = time.perf_counter() - start
+        results[name] = count / elapsed if elapsed > 0 else 0.0
+        print(f"  {name:<12} {count:>6} posts in {elapsed:8.3f}s = {results[name]:10.2f} posts/s", file=sys.stderr)
+
+    def run_stage(stage, where):
+        count = db.count_posts(where)
+        Pipeline([stage], loglevel=loglevel).run(db.iter_posts(where))
+        # A stage which fails posts quickly must not count as fast
+        failed = db.count_posts(where)
+        if failed:
+            raise RuntimeError(f"{stage.name}: {failed} of {count} posts failed")
+        return count
+
+    reset_data()
+    db = DB(loglevel=loglevel)
+    stages = stage_objects()
+
+    timed('crawl', lambda: crawl(db, urls['reddit'], loglevel))
+    if 'audio' in args.stages:
+        timed('audio', lambda: run_stage(stages['audio'], NEEDS_AUDIO))
+    if 'subtitles' in args.stages:
+        timed('subtitles', lambda: run_stage(stages['subtitles'], NEEDS_SUBTITLES))
+    if 'video' in args.stages:
+        timed('video', lambda: run_stage(stages['video'], NEEDS_VIDEO))
+    db.close()
+
+    if 'end_to_end' in args.stages:
+        reset_data()
+        db = DB(loglevel=loglevel)
+        stages = stage_objects()
+
+        def end_to_end():
+            count = crawl(db, urls['reddit'], loglevel)
+            Pipeline([stages['audio'], stages['subtitles'], stages['video']], loglevel=loglevel).run(db.iter_posts(NEEDS_AUDIO))
+            failed = db.count_posts(NEEDS_AUDIO) + db.count_posts(NEEDS_SUBTITLES) + db.count_posts(NEEDS_VIDEO)
+            if failed:
+                raise RuntimeError(f"End to end: {failed} of {count} posts failed")
+            return count
+        timed('end_to_end', end_to_end)
+        db.close()
+
+    if 'crawl' not in args.stages:
+        del results['crawl']
+    return results
+
+def compare(results, baseline, threshold):
+    """
+    Find results which are more than threshold below the baseline.
+
+    Returns:
+        list: Human-readable descriptions of the regressions.
+    """
+    regressions = []
+    for size, stages in baseline.items():
+        for stage, expected in stages.items():
+            actual = results.get(size, {}).get(stage)
+            if actual is not None and actual < expected * (1 - threshold):
+                regressions.append(f"{stage} at size {size}: {actual:.2f} posts/s, baseline {expected:.2f} posts/s")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the vidgen pipeline offline')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 50], help='Corpus sizes to benchmark')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES), help='Stages to benchmark')
+    parser.add_argument('--tts-latency', type=float, default=0.05, help='Seconds the fake TTS server waits per request')
+    parser.add_argument('--asr-delay', type=float, default=0.0, help='Seconds the fake whisper model takes per post')
+    parser.add_argument('--subtitle-mode', choices=('aligned', 'whisper'), default='aligned', help='Subtitle mode, see main.py')
+    parser.add_argument('--audio-workers', type=int, default=16, help='Number of audio threads')
+    parser.add_argument('--video-workers', type=int, default=4, help='Number of video threads')
+    parser.add_argument('--video-codec', default='libx264', help='Video encoder of the video stage, e.g. h264_nvenc')
+    parser.add_argument('--hwaccel', help='Hardware decoding of the video stage, e.g. cuda')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    parser.add_argument('--baseline', help='Compare against the results in this JSON file')
+    parser.add_argument('--save-baseline', help='Write the results as a new baseline to this file')
+    parser.add_argument('--threshold', type=float, default=0.2, help='Allowed relative slowdown against the baseline')
+    args = parser.parse_args()
+
+    loglevel = logging.WARNING
+    root = tempfile.mkdtemp(prefix='vidgen-bench-')
+    configure_paths(root)
+
+    from bench import fixtures
+    from config.dicts import SUBREDDITS
+    from utils import tiktok_tts
+
+    try:
+        mp3 = fixtures.make_silence_mp3(os.path.join(root, 'chunk.mp3'))
+        if 'video' in args.stages or 'end_to_end' in args.stages:
+            fixtures.make_background_video(os.path.join(structure.BACKGROUNDS_DIR, 'synthetic', 'bg.mp4'))
+
+        results = {}
+        for size in args.sizes:
+            print(f"Corpus size {size}", file=sys.stderr)
+            corpus = fixtures.make_corpus(size, SUBREDDITS)
+            with fixtures.reddit_server(corpus) as reddit, \
+                    fixtures.tts_server(mp3, latency=args.tts_latency, style=0) as tts_primary, \
+                    fixtures.tts_server(mp3, latency=args.tts_latency, style=1) as tts_fallback:
+                tiktok_tts.ENDPOINTS[:] = [f'{tts_primary.url}/api/generation', f'{tts_fallback.url}/api/generation']
+                results[str(size)] = run_size(size, args, {'reddit': reddit.url}, loglevel)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    print(json.dumps(results, indent=2))
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as file:
+                json.dump(results, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION: {regression}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -33,6 +33,15 @@ BAD_WORDS = [
     'balls'
 ]
 
+# Crawled posts breaking any of these rules are ignored; None disables a rule
+CONTENT_RULES = {
+    'min_length': 200,          # Characters of title and content
+    'max_length': 15000,
+    'min_duration': 20,         # Estimated seconds of narration
+    'max_duration': 900,
+    'words_per_minute': 160,    # Speaking rate of the TikTok voices, used for the estimate
+}
+
 # These subreddits will be queried for the daily top posts
 # Using either RSS or Web-Scraping (if the subreddit does not support RSS)
 SUBREDDITS = {
@@ -1,5 +1,7 @@
 DB_PATH = 'data/db/db.sqlite3'
+FEED_CACHE_PATH = 'data/db/feed_cache.json'
 AUDIO_DIR = 'data/audio'
+TTS_CACHE_DIR = 'data/cache/tts'
 SUBTITLE_DIR = 'data/subtitles'
 BACKGROUNDS_DIR = 'data/video/bg'
 VIDEO_DIR = 'data/video/done'
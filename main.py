@@ -4,6 +4,8 @@ import argparse
 import concurrent.futures
 import json
 import os
+import itertools
+import threading
 
 from tqdm import tqdm
 from tqdm.contrib.logging import logging_redirect_tqdm
@@ -11,13 +13,27 @@ from tqdm.contrib.logging import logging_redirect_tqdm
 from utils.youtube_uploader import YouTubeUploader
 from src.content_getter import ContentGetter
 from config.dicts import SUBREDDITS
-from config.structure import VIDEO_DIR
-from src.db import DB
+from config.structure import VIDEO_DIR, FEED_CACHE_PATH, TTS_CACHE_DIR
+from src.db import DB, NEEDS_AUDIO, NEEDS_SUBTITLES, NEEDS_VIDEO
+from src.dedup import DedupIndex, NearDuplicateIndex
+from src.feed_cache import FeedCache
+from src.content_filter import ContentFilter
+from src.pipeline import Pipeline, Stage
+from src.jobs import JobQueue, STAGE_CONDITIONS, FAILED
 from utils.logger import setup_logger
 from src.audio_generator import AudioGenerator
-from src.subtitler import Subtitler
+from src.tts_cache import TTSCache
+from utils.tts_client import TTSClient
+from utils.tts_dispatcher import TTSDispatcher
+from src.subtitler import Subtitler, MODES as SUBTITLE_MODES
+from src.transcriber import TranscriptionPool
+from src.asr import BACKENDS as ASR_BACKENDS, get_backend
 from src.composer import Composer
 from utils.text import shorten_string
+from utils import pcm, subtitles
+from utils.metrics import metrics
+from utils.concurrency import ConcurrencyController
+from utils.html_parser import PARSERS
 
 def update_db(logger, db: DB):
     """
@@ -25,56 +41,110 @@ def update_db(logger, db: DB):
     """
     start = time.time()
     logger.info("Updating DB")
-    cg = ContentGetter(loglevel=logging.INFO)
+    feed_cache = None if args.no_feed_cache else FeedCache(FEED_CACHE_PATH)
+    content_filter = None if args.no_content_filter else ContentFilter(min_length=args.min_length, max_length=args.max_length,
+                                                                       min_duration=args.min_duration, max_duration=args.max_duration)
+    cg = ContentGetter(loglevel=logging.INFO, feed_cache=feed_cache, parser=args.html_parser, content_filter=content_filter)
 
-    new_insertions = 0
+    new_posts = []
+    complete = True
 
     with logging_redirect_tqdm(loggers = [logger, cg.logger, db.logger]):
-        for subreddit in tqdm(SUBREDDITS, desc="Subreddits", leave=False):
-            for post in tqdm(cg.from_subreddit(subreddit), desc="Posts", leave=False):
-                if not db.get_post_by_hash(post.hash):
-                    db.insert_post(post)
-                    new_insertions += 1
-
-                    if args.quick and new_insertions >= args.quick_limit:
-                        logger.debug(f"Quick mode: Stopping after {new_insertions} new insertions")
+        known = DedupIndex.from_db(db)
+        near_duplicates = None if args.near_duplicate_distance < 0 else NearDuplicateIndex.from_db(db, max_distance=args.near_duplicate_distance)
+
+        for subreddit, posts in tqdm(cg.crawl(SUBREDDITS), total=len(SUBREDDITS), desc="Subreddits", leave=False):
+            for post in tqdm(posts, desc="Posts", leave=False):
+                if known.add(post.hash):
+                    if near_duplicates is not None and near_duplicates.check(post):
+                        metrics.inc('crawl_near_duplicates_total', subreddit=subreddit)
+                        continue
+                    new_posts.append(post)
+
+                    if args.quick and len(new_posts) >= args.quick_limit:
+                        logger.debug(f"Quick mode: Stopping after {len(new_posts)} new insertions")
                         break
 
-            if args.quick and new_insertions >= args.quick_limit:
+            if args.quick and len(new_posts) >= args.quick_limit:
+                complete = False
                 break
 
+        # OR IGNORE covers posts another process inserted since the index was loaded
+        new_insertions = db.insert_many(new_posts, ignore_existing=True)
+        metrics.inc('crawl_inserted_total', new_insertions)
+        if near_duplicates is not None:
+            near_duplicates.save(db, new_posts)
+
+        # Only remember entries as seen once all of them were ingested
+        if feed_cache and complete:
+            feed_cache.save()
+
     end = time.time()
 
     logger.info(f"DB Update complete. Inserted {new_insertions} new Posts. Finished in {end - start} seconds")
 
-def generate_audio(logger, db: DB, num_threads=16):
+def submit_bounded(executor, fn, items, max_pending):
+    """
+    Submit fn(item) for each item while keeping at most max_pending futures in flight.
+
+    Items are only pulled from the iterable when a slot frees up, so a lazy
+    DB iterator is never materialized in full.
+
+    Yields:
+        tuple: (item, future) pairs in order of completion.
+    """
+    items = iter(items)
+    pending = {executor.submit(fn, item): item for item in itertools.islice(items, max_pending)}
+
+    while pending:
+        done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            item = pending.pop(future)
+            for next_item in itertools.islice(items, 1):
+                pending[executor.submit(fn, next_item)] = next_item
+            yield item, future
+
+def make_audio_generator(limiter: ConcurrencyController = None):
+    """
+    Create an AudioGenerator, with the TTS chunk cache unless it is disabled.
+
+    The chunk requests of all posts share one dispatcher, so at most
+    --tts-concurrency requests are in flight however many posts are.
+    Rate limit responses of the TTS endpoints are reported to the limiter
+    of the audio stage, if given.
+    """
+    cache = TTSCache(TTS_CACHE_DIR, args.tts_cache_mb * 1024 * 1024) if args.tts_cache_mb > 0 else None
+    client = TTSClient(pool_size=args.tts_concurrency, hedge_quantile=args.tts_hedge_quantile, hedge_budget=args.tts_hedge_budget,
+                       on_rate_limit=limiter.report_rate_limit if limiter else None)
+    dispatcher = TTSDispatcher(client, concurrency=args.tts_concurrency, rate=args.tts_rate)
+    # Aligned subtitles are laid out from the chunk timings, so only transcription reads the PCM
+    return AudioGenerator(loglevel=logging.INFO, cache=cache, dispatcher=dispatcher, pcm_sidecar=args.pcm_sidecar and args.subtitle_mode == 'whisper')
+
+def generate_audio(logger, db: DB, limiter: ConcurrencyController):
     """
     Generate audio from Posts in the DB using multiple threads.
+
+    The number of concurrent threads is adapted at runtime by the limiter.
     """
     start = time.time()
     logger.info("Generating audio")
-    ag = AudioGenerator(loglevel=logging.INFO)
+    ag = make_audio_generator(limiter)
 
     failed_number = 0
     successes = 0
 
-    all_posts = db.get_all_posts()
-    if args.quick:
-        all_posts = all_posts[:args.quick_limit] # only work on quick_limit posts in quick mode
-    num_posts=len(all_posts)
-    bar = tqdm(total=num_posts, desc="Audios", leave=False)
+    limit = args.quick_limit if args.quick else None # only work on quick_limit posts in quick mode
+    num_posts = db.count_posts(NEEDS_AUDIO)
+    bar = tqdm(total=num_posts if limit is None else min(num_posts, limit), desc="Audios", leave=False)
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=num_threads) as executor, logging_redirect_tqdm(loggers=[logger, ag.logger, db.logger]):
-        future_to_post = {executor.submit(process_individual_post, post, ag, post.audio): post for post in all_posts}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=limiter.max_workers) as executor, logging_redirect_tqdm(loggers=[logger, ag.logger, db.logger]), db.transaction():
+        all_posts = db.iter_posts(NEEDS_AUDIO, limit=limit)
 
-        for future in concurrent.futures.as_completed(future_to_post):
-            post = future_to_post[future]
+        for post, future in submit_bounded(executor, lambda post: process_individual_post(post, ag, db, 'audio', limiter=limiter), all_posts, limiter.max_workers * 2):
             bar.set_postfix_str(post.short_hash) #update progressbar
             try:
                 result = future.result()
                 if result:
-                    post.audio = True
-                    db.update_post(post) #TODO
                     successes += 1
 
                     if args.quick and successes >= args.quick_limit:
@@ -82,8 +152,7 @@ def generate_audio(logger, db: DB, num_threads=16):
                         break
                 else:
                     failed_number += 1
-                    logger.debug(f"Failed to generate audio for post {post.short_hash} -- Deleting from DB")
-                    db.delete_post(post) #TODO
+                    logger.debug(f"Failed to generate audio for post {post.short_hash} -- Deleted from DB")
 
             except Exception as exc:
                 logger.error(f"Error processing post {post.short_hash}: {exc}")
@@ -93,59 +162,129 @@ def generate_audio(logger, db: DB, num_threads=16):
 
     end = time.time()
     bar.close()
-    logger.info(f"Generated audio for {successes} Posts ({failed_number} failed). Finished in {end - start} seconds ({(end - start) / successes} seconds per Post)")
+    logger.info(f"Generated audio for {successes} Posts ({failed_number} failed). Finished in {end - start} seconds ({per_post(end - start, successes)})")
+    if ag.cache:
+        stats = ag.cache.stats()
+        logger.info(f"TTS cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%}), {stats['evictions']} evictions, {stats['bytes'] / 1e6:.1f} MB")
+    if ag.client.hedge_quantile is not None:
+        stats = ag.client.hedge_stats()
+        logger.info(f"TTS hedging: {stats['hedges']} hedges for {stats['requests']} requests, {stats['wins']} answered first ({stats['win_rate']:.0%})")
+
+def per_post(seconds, successes):
+    """
+    Format the average time per successful Post for the stage summaries.
+    """
+    if not successes:
+        return "no Posts succeeded"
+    return f"{seconds / successes} seconds per Post"
 
-def process_individual_post(post, generator, property):
-    if not property:
-        if generator.from_post(post):
-            return True
-        else:
-            return False
-    return True
+def delete_post(db: DB, post):
+    """
+    Delete a Post from the DB, along with the sidecars the audio stage wrote for the subtitle stage.
+    """
+    db.delete_post(post)
+    for path in (pcm.sidecar_path(post.hash), subtitles.timings_path(post.hash)):
+        if os.path.isfile(path):
+            os.remove(path)
 
-def generate_subtitles(logger, db: DB):
+def process_individual_post(post, generator, db: DB, flag, delete_on_failure=True, limiter: ConcurrencyController = None):
     """
-    Generate subtitles from Posts in the DB.
+    Run a generator on a Post in a worker thread and store the result right away.
+
+    Args:
+        post (Post): The post to process.
+        generator: An AudioGenerator, Composer or similar with a from_post() method.
+        db (DB): The DB to store the result in.
+        flag (str): The stage flag of the post, such as 'audio'.
+        delete_on_failure (bool): Whether to delete the post from the DB if the generator fails.
+        limiter (ConcurrencyController, optional): Runs the generator. Posts which were already processed
+                                                   skip it, so their no-op latency does not skew its limit.
+
+    Returns:
+        bool: True if the post was already processed or processing succeeded, False otherwise.
+
+    Exceptions of the generator, which signal a failure of the stage rather than of the post,
+    are passed on without deleting the post.
     """
+    if getattr(post, flag):
+        return True
+
+    start = time.perf_counter()
+    result = limiter.run(generator.from_post, post) if limiter else generator.from_post(post)
+    metrics.observe('stage_item_seconds', time.perf_counter() - start, stage=flag)
+    metrics.inc('stage_items_total', stage=flag, result='success' if result else 'failure')
+
+    if result:
+        db.set_flags(post, **{flag: True})
+        return True
+    if delete_on_failure:
+        delete_post(db, post)
+    return False
+
+def make_subtitler():
+    """
+    Create a Subtitler with the configured ASR backend, transcribing in a pool of worker processes if more than one whisper worker is configured.
 
-    ### We cannot multithread this well since Subtitler uses a
-    ### full machine learning model loaded into RAM in the background.
-    ### For multiple threads, we would need to load it multiple times. bad idea.
-    ### If you implement Subtitler() to, i.e., use a server such as the whisper API,
-    ### then you can multithread this
+    Either way, the model is only loaded once a post actually needs transcription.
+    """
+    options = {
+        'model_name': args.asr_model,
+        'compute_type': args.asr_compute_type,
+        'beam_size': args.asr_beam_size,
+        'language': args.asr_language,
+        'vad': args.asr_vad,
+    }
+    if args.whisper_workers > 1:
+        model = TranscriptionPool(args.whisper_workers, threads=args.whisper_threads, backend=args.asr_backend, options=options)
+    else:
+        model = get_backend(args.asr_backend, threads=args.whisper_threads, **options)
+    return Subtitler(loglevel=logging.INFO, model=model, mode=args.subtitle_mode)
 
+def generate_subtitles(logger, db: DB):
+    """
+    Generate subtitles from Posts in the DB, with one thread per whisper worker.
+    """
     start = time.time()
     logger.info("Generating subtitles")
-    st = Subtitler(loglevel=logging.INFO)
+    st = make_subtitler()
 
     failed_number = 0
     successes = 0
 
-    with logging_redirect_tqdm(loggers = [logger, st.logger, db.logger]):
-        for post in tqdm(db.get_all_posts(), desc="Posts", leave=False):
-            if st.from_post(post):
-                post.subtitles = True
-                db.update_post(post)
-                successes += 1
+    with concurrent.futures.ThreadPoolExecutor(max_workers=args.subtitle_workers) as executor, logging_redirect_tqdm(loggers = [logger, st.logger, db.logger]), db.transaction(batch_size=50):
+        # Subtitler only needs the hash and flags, so don't load the post content
+        all_posts = db.iter_posts(NEEDS_SUBTITLES, columns=('audio', 'subtitles'))
+        bar = tqdm(total=db.count_posts(NEEDS_SUBTITLES), desc="Posts", leave=False)
+        for post, future in submit_bounded(executor, lambda post: process_individual_post(post, st, db, 'subtitles', delete_on_failure=False), all_posts, args.subtitle_workers * 2):
+            try:
+                if future.result():
+                    successes += 1
+
+                    if args.quick and successes >= args.quick_limit:
+                        logger.debug(f"Quick mode: Stopping after {successes} successes")
+                        break
+
+                else:
+                    failed_number += 1
+                    logger.debug(f"Failed to generate subtitles for post {post.short_hash} -- Deleting from DB")
+                    delete_post(db, post)
 
-                if args.quick and successes >= args.quick_limit:
-                    logger.debug(f"Quick mode: Stopping after {successes} successes")
-                    break
+            except Exception as exc:
+                logger.error(f"Error processing post {post.short_hash}: {exc}")
 
-            else:
-                failed_number += 1
-                logger.debug(f"Failed to generate subtitles for post {post.short_hash} -- Deleting from DB")
-                db.delete_post(post)
+            finally:
+                bar.update(1)
+        bar.close()
 
+    st.close()
     end = time.time()
-    logger.info(f"Generated subtitles for {successes} Posts ({failed_number} failed). Finished in {end - start} seconds ({(end - start) / successes} seconds per Post)")
+    logger.info(f"Generated subtitles for {successes} Posts ({failed_number} failed). Finished in {end - start} seconds ({per_post(end - start, successes)})")
 
-def compose_video(logger, db:DB, num_threads=16):
-    """
-    Compose video from Posts in the DB.
-    """
+def compose_video(logger, db:DB, limiter: ConcurrencyController):
     """
     Compose video from Posts in the DB using multiple threads.
+
+    The number of concurrent threads is adapted at runtime by the limiter.
     """
     start = time.time()
     logger.info("Composing video")
@@ -154,23 +293,19 @@ def compose_video(logger, db:DB, num_threads=16):
     failed_number = 0
     successes = 0
 
-    all_posts = db.get_all_posts()
-    if args.quick:
-        all_posts = all_posts[:args.quick_limit]  # only work on quick_limit posts in quick mode
-    num_posts = len(all_posts)
-    bar = tqdm(total=num_posts, desc="Videos", leave=False)
+    limit = args.quick_limit if args.quick else None  # only work on quick_limit posts in quick mode
+    num_posts = db.count_posts(NEEDS_VIDEO)
+    bar = tqdm(total=num_posts if limit is None else min(num_posts, limit), desc="Videos", leave=False)
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=num_threads) as executor, logging_redirect_tqdm(loggers=[logger, vc.logger, db.logger]):
-        future_to_post = {executor.submit(process_individual_post, post, vc, post.video): post for post in all_posts}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=limiter.max_workers) as executor, logging_redirect_tqdm(loggers=[logger, vc.logger, db.logger]), db.transaction():
+        # Composer only needs the hash and flags, so don't load the post content
+        all_posts = db.iter_posts(NEEDS_VIDEO, columns=('audio', 'subtitles', 'video', 'audio_duration'), limit=limit)
 
-        for future in concurrent.futures.as_completed(future_to_post):
-            post = future_to_post[future]
+        for post, future in submit_bounded(executor, lambda post: process_individual_post(post, vc, db, 'video', delete_on_failure=False, limiter=limiter), all_posts, limiter.max_workers * 2):
             bar.set_postfix_str(post.short_hash)  # update progress bar
             try:
                 result = future.result()
                 if result:
-                    post.video = True
-                    # db.update_post(post)  # Uncomment and implement if needed
                     successes += 1
 
                     if args.quick and successes >= args.quick_limit:
@@ -178,8 +313,7 @@ def compose_video(logger, db:DB, num_threads=16):
                         break
                 else:
                     failed_number += 1
-                    logger.debug(f"Failed to compose video for post {post.short_hash} -- Deleting from DB")
-                    # db.delete_post(post)  # Uncomment and implement if needed
+                    logger.debug(f"Failed to compose video for post {post.short_hash}")
 
             except Exception as exc:
                 logger.error(f"Error processing post {post.short_hash}: {exc}")
@@ -189,7 +323,119 @@ def compose_video(logger, db:DB, num_threads=16):
 
     end = time.time()
     bar.close()
-    logger.info(f"Composed video for {successes} Posts ({failed_number} failed). Finished in {end - start} seconds ({(end - start) / successes} seconds per Post)")
+    logger.info(f"Composed video for {successes} Posts ({failed_number} failed). Finished in {end - start} seconds ({per_post(end - start, successes)})")
+
+def run_pipeline(logger, db: DB, limiters):
+    """
+    Generate audio, subtitles and video with all stages running at the same time.
+
+    Each Post moves on to the next stage as soon as it is done with the previous one.
+    """
+    logger.info("Running pipeline")
+
+    stages = []
+    conditions = []
+    if not args.no_audio:
+        ag = make_audio_generator(limiters['audio'])
+        stages.append(Stage('Audio', lambda post: process_individual_post(post, ag, db, 'audio', limiter=limiters['audio']), workers=limiters['audio'].max_workers))
+        conditions.append(NEEDS_AUDIO)
+    if not args.no_subtitles:
+        st = make_subtitler()
+        stages.append(Stage('Subtitles', lambda post: process_individual_post(post, st, db, 'subtitles'), workers=args.subtitle_workers))
+        conditions.append(NEEDS_SUBTITLES)
+    if not args.no_video:
+        vc = Composer(loglevel=logging.INFO)
+        stages.append(Stage('Video', lambda post: process_individual_post(post, vc, db, 'video', delete_on_failure=False, limiter=limiters['video']), workers=limiters['video'].max_workers))
+        conditions.append(NEEDS_VIDEO)
+
+    if not stages:
+        return
+
+    # Only feed Posts which at least one of the enabled stages still has to work on
+    where = ' OR '.join(f'({condition})' for condition in conditions)
+    posts = db.iter_posts(where, limit=args.quick_limit if args.quick else None)
+
+    with logging_redirect_tqdm(loggers=[logger, db.logger]), db.transaction():
+        Pipeline(stages, loglevel=logging.INFO).run(posts)
+
+def run_worker(logger, db: DB, stage, limiters):
+    """
+    Work through the persistent job queue of one stage.
+
+    Any number of worker processes on the machine of the DB file can drain the
+    same queue; claimed jobs are leased, so no Post is processed twice and jobs
+    of crashed workers are picked up again once their lease runs out.
+    """
+    start = time.time()
+    logger.info(f"Starting {stage} worker")
+
+    if stage == 'audio':
+        generator = make_audio_generator(limiters.get(stage))
+    elif stage == 'subtitles':
+        generator = make_subtitler()
+    else:
+        generator = Composer(loglevel=logging.INFO)
+
+    limiter = limiters.get(stage)
+    num_threads = limiter.max_workers if limiter else args.subtitle_workers
+
+    jobs = JobQueue(db, stage, lease_seconds=args.lease_seconds, loglevel=logging.INFO)
+    successes = 0
+    failed_number = 0
+    counter_lock = threading.Lock()
+
+    def next_job():
+        job = jobs.claim()
+        if job is None and jobs.enqueue_ready():
+            job = jobs.claim()
+        while job is None and args.worker_poll > 0:
+            time.sleep(args.worker_poll)
+            jobs.enqueue_ready()
+            job = jobs.claim()
+        return job
+
+    def work():
+        nonlocal successes, failed_number
+        while (job := next_job()) is not None:
+            post_hash, token = job
+            post = db.get_post_by_hash(post_hash)
+            if post is None:
+                # Deleted since the job was created, nothing to do
+                jobs.complete(post_hash, token)
+                continue
+
+            try:
+                with jobs.keep_alive(post_hash, token):
+                    result = process_individual_post(post, generator, db, stage, delete_on_failure=False, limiter=limiter)
+                reason = None if result else f"{stage} generation failed"
+                stage_error = False
+            except Exception as exc:
+                # Generators report failures of a post by returning False, exceptions are failures
+                # of the stage itself (e.g. its workers died), so don't give up on the post for them
+                logger.error(f"Error processing post {post.short_hash}: {exc}")
+                result, reason, stage_error = False, str(exc), True
+
+            with counter_lock:
+                if result:
+                    successes += 1
+                else:
+                    failed_number += 1
+
+            if result:
+                jobs.complete(post_hash, token)
+            elif jobs.fail(post_hash, token, reason, stage_error=stage_error) == FAILED and stage != 'video':
+                logger.debug(f"Giving up on post {post.short_hash} after {jobs.max_attempts} attempts -- Deleting from DB")
+                delete_post(db, post)
+
+    with logging_redirect_tqdm(loggers=[logger, jobs.logger, db.logger]):
+        threads = [threading.Thread(target=work, name=f"{stage}-worker-{n}") for n in range(num_threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    end = time.time()
+    logger.info(f"{stage} worker done: {successes} succeeded, {failed_number} failed, queue {jobs.counts()}. Finished in {end - start} seconds")
 
 def upload_to_youtube(logger, db: DB):
     """
@@ -233,28 +479,85 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Crawl Reddit and generate audio')
     parser.add_argument('--no-audio', dest='no_audio', action='store_true', help='Do not generate audio')
     parser.add_argument('--no-web-update', dest='no_web', action='store_true', help='Do not update DB with new Posts from Reddit')
+    parser.add_argument('--no-feed-cache', dest='no_feed_cache', action='store_true', help='Fetch and parse every feed in full instead of using conditional requests')
+    parser.add_argument('--html-parser', dest='html_parser', choices=list(PARSERS), help='HTML parser backend for crawling (default: the fastest installed one)')
+    parser.add_argument('--no-content-filter', dest='no_content_filter', action='store_true', help='Keep posts with bad words or outside the length rules')
+    parser.add_argument('--min-length', dest='min_length', type=int, help='Ignore posts with fewer characters (default: CONTENT_RULES in config/dicts.py)')
+    parser.add_argument('--max-length', dest='max_length', type=int, help='Ignore posts with more characters (default: CONTENT_RULES in config/dicts.py)')
+    parser.add_argument('--min-duration', dest='min_duration', type=float, help='Ignore posts with an estimated narration shorter than this many seconds')
+    parser.add_argument('--max-duration', dest='max_duration', type=float, help='Ignore posts with an estimated narration longer than this many seconds')
+    parser.add_argument('--near-duplicate-distance', dest='near_duplicate_distance', type=int, default=6, help='Ignore crawled posts whose SimHash differs from a stored post in at most this many of 64 bits; -1 disables the check')
+    parser.add_argument('--tts-cache-mb', dest='tts_cache_mb', type=int, default=512, help='Size budget of the on-disk cache of synthesized TTS chunks in MB; 0 disables it')
+    parser.add_argument('--subtitle-mode', dest='subtitle_mode', choices=SUBTITLE_MODES, default='aligned', help="How to generate subtitles: 'aligned' lays out the known post text over the measured TTS chunk durations and only falls back to whisper without them, 'whisper' always transcribes")
+    parser.add_argument('--asr-backend', dest='asr_backend', choices=list(ASR_BACKENDS), default='whisper', help="Speech recognition for subtitles which are transcribed: 'whisper' (openai-whisper, fp32) or 'faster-whisper' (CTranslate2, int8 by default)")
+    parser.add_argument('--asr-model', dest='asr_model', default='small.en', help='Whisper model size or path of the ASR backend')
+    parser.add_argument('--asr-compute-type', dest='asr_compute_type', help='CTranslate2 compute type of faster-whisper, e.g. int8, int8_float32, float32 (default: int8)')
+    parser.add_argument('--asr-beam-size', dest='asr_beam_size', type=int, help='Beam search width (default: greedy for whisper, 5 for faster-whisper)')
+    parser.add_argument('--asr-language', dest='asr_language', help='Transcribe in this language instead of detecting it, e.g. en')
+    parser.add_argument('--asr-vad', dest='asr_vad', action='store_true', help='Skip silence with faster-whisper\'s voice activity detection')
+    parser.add_argument('--pcm-sidecar', dest='pcm_sidecar', action='store_true', help='Also store the audio as 16 kHz mono PCM, which the subtitle stage transcribes without decoding the MP3 again. Only used with --subtitle-mode whisper')
+    parser.add_argument('--tts-concurrency', dest='tts_concurrency', type=int, default=16, help='Maximum number of TTS requests in flight across all posts')
+    parser.add_argument('--tts-rate', dest='tts_rate', type=float, default=0, help='Maximum number of TTS requests started per second; 0 for no limit')
+    parser.add_argument('--tts-hedge-quantile', dest='tts_hedge_quantile', type=float, help='Send a TTS request to a second endpoint too once it takes longer than this quantile of recent latencies, e.g. 0.95 (default: no hedging)')
+    parser.add_argument('--tts-hedge-budget', dest='tts_hedge_budget', type=float, default=0.1, help='Maximum share of extra TTS requests sent as hedges')
     parser.add_argument('--quick', dest='quick', action='store_true', help=f'Only do limited Posts (--quick-limit, default 1) (for testing purposes')
     parser.add_argument('--no-subtitles', dest='no_subtitles', action='store_true', help='Do not generate subtitles')
     parser.add_argument('--no-video', dest='no_video', action='store_true', help='Do not compose video')
     parser.add_argument('--quick-limit', dest='quick_limit', type=int, default=1, help='Number of Posts to do (for testing purposes)')
     parser.add_argument('--no-youtube-upload', dest='no_youtube_upload', action='store_true', help='Do not upload to YouTube')
+    parser.add_argument('--pipeline', dest='pipeline', action='store_true', help='Run audio, subtitle and video generation concurrently, streaming each Post through the stages')
+    parser.add_argument('--audio-workers', dest='audio_workers', type=int, default=16, help='Initial number of concurrent audio threads, adapted at runtime')
+    parser.add_argument('--audio-min-workers', dest='audio_min_workers', type=int, default=1, help='Lowest number of concurrent audio threads')
+    parser.add_argument('--audio-max-workers', dest='audio_max_workers', type=int, default=64, help='Highest number of concurrent audio threads')
+    parser.add_argument('--subtitle-workers', dest='subtitle_workers', type=int, help='Number of subtitle threads (default: one per whisper worker)')
+    parser.add_argument('--whisper-workers', dest='whisper_workers', type=int, default=1, help='Number of whisper processes, each loading the model once; 1 transcribes in the main process')
+    parser.add_argument('--whisper-threads', dest='whisper_threads', type=int, help='Number of torch threads per whisper process (default: an equal share of the CPUs)')
+    parser.add_argument('--video-workers', dest='video_workers', type=int, default=4, help='Initial number of concurrent video threads, adapted at runtime')
+    parser.add_argument('--video-min-workers', dest='video_min_workers', type=int, default=1, help='Lowest number of concurrent video threads')
+    parser.add_argument('--video-max-workers', dest='video_max_workers', type=int, default=os.cpu_count() or 4, help='Highest number of concurrent video threads (default: number of CPUs)')
+    parser.add_argument('--worker', dest='worker', choices=sorted(STAGE_CONDITIONS), help='Only work through the persistent job queue of this stage; can run in several processes at once')
+    parser.add_argument('--worker-poll', dest='worker_poll', type=float, default=0, help='In --worker mode, poll for new jobs every this many seconds instead of exiting when the queue is empty')
+    parser.add_argument('--metrics-json', dest='metrics_json', help='Write a JSON report of the run metrics to this file')
+    parser.add_argument('--metrics-prom', dest='metrics_prom', help='Write the run metrics to this Prometheus textfile collector file (*.prom)')
+    parser.add_argument('--lease-seconds', dest='lease_seconds', type=float, default=300, help='In --worker mode, how long a claimed job stays reserved without a heartbeat')
     args = parser.parse_args()
+    if args.subtitle_workers is None:
+        args.subtitle_workers = args.whisper_workers
 
     global_start = time.time()
     logger = setup_logger(__name__, logging.INFO, emoji='👑')
     db = DB(loglevel=logging.INFO)
 
-    if not args.no_web:
+    # TTS is network-bound, ffmpeg is CPU-bound and should back off on a saturated machine
+    limiters = {
+        'audio': ConcurrencyController('audio', args.audio_min_workers, args.audio_max_workers, initial=args.audio_workers),
+        'video': ConcurrencyController('video', args.video_min_workers, args.video_max_workers, initial=args.video_workers, cpu_bound=True),
+    }
+
+    # Workers only drain the job queue; crawling is left to a regular run
+    if not args.no_web and not args.worker:
         update_db(logger, db)
     
-    if not args.no_audio:
-        generate_audio(logger, db)
+    if args.worker:
+        run_worker(logger, db, args.worker, limiters)
+    elif args.pipeline:
+        run_pipeline(logger, db, limiters)
+    else:
+        if not args.no_audio:
+            generate_audio(logger, db, limiters['audio'])
 
-    if not args.no_subtitles:
-        generate_subtitles(logger, db)
+        if not args.no_subtitles:
+            generate_subtitles(logger, db)
 
-    if not args.no_video:
-        compose_video(logger, db)
+        if not args.no_video:
+            compose_video(logger, db, limiters['video'])
 
     if not args.no_youtube_upload:
-        upload_to_youtube(logger, db)
\ No newline at end of file
+        upload_to_youtube(logger, db)
+
+    if args.metrics_json:
+        metrics.write_json(args.metrics_json)
+        logger.info(f"Wrote run report to {args.metrics_json}")
+    if args.metrics_prom:
+        metrics.write_prometheus(args.metrics_prom)
+        logger.info(f"Wrote Prometheus metrics to {args.metrics_prom}")
@@ -2,12 +2,39 @@ import hashlib
 import re
 
 from config.dicts import REDDIT_SLANG
-from utils.text import shorten_string, shorten_hash, replace_words
+from utils.text import shorten_string, shorten_hash, collapse_whitespace, TextNormalizer
+
+# Shared by all Posts, so the patterns are only compiled once
+_normalize = TextNormalizer(REDDIT_SLANG)
+
+_LEGACY_SLANG = [(word.lower(), replacement) for word, replacement in REDDIT_SLANG.items()]
+_LEGACY_TAG_PATTERN = re.compile(r"\(?\d{1,3}[mfMF]\)?")
+_LEGACY_SPACES_PATTERN = re.compile(' +')
+
+def _legacy_title(title):
+    """
+    Normalize a title exactly like Post did before TextNormalizer, for the hash only.
+
+    The old slang replacement lowercased the whole text and also replaced inside
+    words ('still' became 'stoday i learnedl'), so the displayed title differs
+    from what known posts were hashed over. Hashing this keeps re-crawled posts
+    at the hash they are stored under. See bench/hashes.py.
+    """
+    for word, replacement in _LEGACY_SLANG:
+        title = title.lower().replace(word, replacement)
+    title = _LEGACY_TAG_PATTERN.sub('', title).strip()
+    title = title.replace('\n', ' ').replace('\t', ' ')
+    return _LEGACY_SPACES_PATTERN.sub(' ', title).strip()
 
 class Post:
     """
     A class representing a Reddit post.
     """
+    # No per-instance __dict__, which keeps large crawls and migrations compact
+    __slots__ = ('title', 'author', 'subreddit', 'content', 'crawl_date', 'hash', 'short_title', 'short_hash',
+                 'audio', 'subtitles', 'video', 'uploaded_youtube', 'posted_to',
+                 'audio_duration', 'audio_sample_rate', 'audio_channels')
+
     def __init__(self, title, author, subreddit, content, crawl_date):
         """
         Initialize a Post object.
@@ -25,29 +52,18 @@ class Post:
         
         """
         # Simple data stores
-        self.author = author
         self.subreddit = subreddit
         self.crawl_date = crawl_date
 
-        # Replace Reddit slang in title and content
-        self.title = replace_words(title, REDDIT_SLANG)
-        self.content = replace_words(content, REDDIT_SLANG)
-
-        # Remove Age/Gender Reddit-typical tuples
-        self.title = re.sub(r"\(?\d{1,3}[mfMF]\)?", '', self.title).strip()
-        self.content = re.sub(r"\(?\d{1,3}[mfMF]\)?", '', self.content).strip()
-
-        # Clean up potentially spammy fields
-        self.author = self.author.replace('\n', ' ').replace('\t', ' ')
-        self.author = re.sub(' +', ' ', self.author).strip()
-        self.title = self.title.replace('\n', ' ').replace('\t', ' ')
-        self.title = re.sub(' +', ' ', self.title).strip()
-        self.content = self.content.replace('\n', ' ').replace('\t', ' ')
-        self.content = re.sub(' +', ' ', self.content).strip()
+        # Replace Reddit slang, remove Age/Gender Reddit-typical tuples and clean up whitespace in one pass
+        self.title = _normalize(title)
+        self.content = _normalize(content)
+        self.author = collapse_whitespace(author)
 
         # Calculate hash from title + author + post
+        # over the legacy normalization of the title, which keeps hashes of known posts stable
         self.hash = hashlib.sha256(
-            str.encode(self.title) + str.encode(self.author) +
+            str.encode(_legacy_title(title)) + str.encode(self.author) +
             str.encode(self.subreddit)
         ).hexdigest()
 
@@ -61,9 +77,60 @@ class Post:
         self.video = False
         self.uploaded_youtube = False
 
+        # Recorded by the audio stage, so later stages need not probe the audio file
+        self.audio_duration = None
+        self.audio_sample_rate = None
+        self.audio_channels = None
+
         # Used for storing which platforms the post has been uploaded to
         self.posted_to = []
 
+    def __setstate__(self, state):
+        """
+        Restore a pickled Post, including ones pickled before Post had __slots__.
+
+        :param state: An attribute dict, or a (dict, slots dict) tuple.
+        """
+        if isinstance(state, tuple):
+            state = {**(state[0] or {}), **state[1]}
+        for name, value in state.items():
+            if name in self.__slots__:
+                setattr(self, name, value)
+
+    @classmethod
+    def from_dict(cls, data):
+        """
+        Restore a Post object from already-normalized stored fields.
+
+        Unlike the constructor, this does not re-run slang replacement or
+        cleanup, so the stored title and hash are kept exactly as they were.
+
+        :param data: A mapping of Post attribute names to values.
+        :type data: dict
+        :return: The restored Post object.
+        """
+        post = cls.__new__(cls)
+        post.title = data['title']
+        post.author = data['author']
+        post.subreddit = data['subreddit']
+        post.content = data['content']
+        post.crawl_date = data['crawl_date']
+        post.hash = data['hash']
+
+        post.short_title = shorten_string(post.title)
+        post.short_hash = shorten_hash(post.hash)
+
+        post.audio = bool(data.get('audio', False))
+        post.subtitles = bool(data.get('subtitles', False))
+        post.video = bool(data.get('video', False))
+        post.uploaded_youtube = bool(data.get('uploaded_youtube', False))
+        post.posted_to = list(data.get('posted_to', []))
+
+        post.audio_duration = data.get('audio_duration')
+        post.audio_sample_rate = data.get('audio_sample_rate')
+        post.audio_channels = data.get('audio_channels')
+        return post
+
     def __str__(self, short=True) -> str:
         return f"""{self.hash}
 ├── title:      {self.title},
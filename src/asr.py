@@ -0,0 +1,158 @@
+"""
+Speech recognition backends for Subtitler.
+
+Every backend has whisper's transcribe() interface: it takes an audio path,
+the path of a PCM sidecar (see utils/pcm.py) or 16 kHz mono float32 samples
+and returns a dict with the recognized 'text',
+its 'language' and 'segments' with 'start', 'end' and 'text'. Models are
+loaded on the first transcription, so creating a backend is cheap.
+
+faster-whisper runs the whisper models on CTranslate2, which with int8
+weights transcribes several times faster per CPU core than openai-whisper
+at fp32, at nearly the same accuracy.
+"""
+import importlib.util
+import inspect
+import logging
+import threading
+
+from utils import pcm
+from utils.logger import setup_logger
+
+def _load_audio(audio):
+    # PCM sidecars are loaded here rather than by the caller, so they can be
+    # passed to worker processes by path
+    if isinstance(audio, str) and audio.endswith(pcm.SUFFIX):
+        return pcm.load(audio)
+    return audio
+
+class WhisperBackend:
+    """
+    openai-whisper, at fp32 on the CPU.
+
+    Transcriptions of one backend run one at a time: whisper installs its
+    kv-cache hooks on the shared model for every decode, so concurrent
+    decodes would corrupt each other. Use a TranscriptionPool to run several.
+    """
+    name = 'whisper'
+    module = 'whisper'
+
+    def __init__(self, model_name='small.en', beam_size=None, language=None, threads=None, loglevel = logging.INFO):
+        """
+        Args:
+            model_name (str): The whisper model, e.g. 'small.en'.
+            beam_size (int, optional): Beam search width; greedy decoding if None.
+            language (str, optional): Skip language detection and transcribe in this language.
+            threads (int, optional): The number of torch threads.
+        """
+        self.logger = setup_logger(__name__, loglevel, emoji='🗣️')
+        self.model_name = model_name
+        self.beam_size = beam_size
+        self.language = language
+        self.threads = threads
+        self._model = None
+        self._lock = threading.Lock()
+        self._transcribe_lock = threading.Lock()
+
+    def load(self):
+        """Load the model, if it is not loaded yet."""
+        with self._lock:
+            if self._model is None:
+                import torch
+                import whisper
+
+                if self.threads:
+                    torch.set_num_threads(self.threads)
+                    try:
+                        torch.set_num_interop_threads(1)
+                    except RuntimeError:
+                        # Only possible before torch ran anything in parallel
+                        pass
+                self.logger.info(f"Loading whisper model {self.model_name}")
+                self._model = whisper.load_model(self.model_name, device='cpu')
+            return self._model
+
+    def transcribe(self, audio, **kwargs):
+        options = {'fp16': False, 'language': self.language, 'beam_size': self.beam_size, **kwargs}
+        model = self.load()
+        audio = _load_audio(audio)
+        with self._transcribe_lock:
+            return model.transcribe(audio, **options)
+
+class FasterWhisperBackend:
+    """
+    faster-whisper (CTranslate2), by default with int8 weights.
+    """
+    name = 'faster-whisper'
+    module = 'faster_whisper'
+
+    def __init__(self, model_name='small.en', compute_type='int8', beam_size=None, language=None, vad=False, threads=None, loglevel = logging.INFO):
+        """
+        Args:
+            model_name (str): The whisper model, e.g. 'small.en', or the path of a converted model.
+            compute_type (str): The CTranslate2 compute type, e.g. 'int8', 'int8_float32' or 'float32'.
+            beam_size (int, optional): Beam search width, 5 if None.
+            language (str, optional): Skip language detection and transcribe in this language.
+            vad (bool): Skip silence detected by the Silero VAD filter.
+            threads (int, optional): The number of CPU threads; CTranslate2 picks if None.
+        """
+        self.logger = setup_logger(__name__, loglevel, emoji='🗣️')
+        self.model_name = model_name
+        self.compute_type = compute_type
+        self.beam_size = beam_size if beam_size is not None else 5
+        self.language = language
+        self.vad = vad
+        self.threads = threads
+        self._model = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Load the model, if it is not loaded yet."""
+        with self._lock:
+            if self._model is None:
+                from faster_whisper import WhisperModel
+
+                self.logger.info(f"Loading faster-whisper model {self.model_name} ({self.compute_type})")
+                self._model = WhisperModel(self.model_name, device='cpu', compute_type=self.compute_type, cpu_threads=self.threads or 0)
+            return self._model
+
+    def transcribe(self, audio, **kwargs):
+        options = {'beam_size': self.beam_size, 'language': self.language, 'vad_filter': self.vad, **kwargs}
+        # Segments are generated lazily while decoding
+        segments, info = self.load().transcribe(_load_audio(audio), **options)
+        segments = [{'id': i, 'start': segment.start, 'end': segment.end, 'text': segment.text} for i, segment in enumerate(segments)]
+        return {'text': ''.join(segment['text'] for segment in segments), 'segments': segments, 'language': info.language}
+
+BACKENDS = {backend.name: backend for backend in (WhisperBackend, FasterWhisperBackend)}
+
+def available_backends():
+    """
+    Returns:
+        list: The names of the backends whose packages are installed.
+    """
+    return [name for name, backend in BACKENDS.items() if importlib.util.find_spec(backend.module) is not None]
+
+def get_backend(name='whisper', **options):
+    """
+    Create a backend by name.
+
+    Options which are None are left at the backend's defaults. Options a backend
+    does not support, such as vad for whisper, are left out with a warning
+    unless they are unset (None or False).
+
+    Args:
+        name (str): One of BACKENDS.
+        options: Passed to the backend, e.g. model_name, beam_size, language.
+
+    Raises:
+        ValueError: If there is no backend of that name.
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown ASR backend {name}, choose from {', '.join(BACKENDS)}")
+    parameters = inspect.signature(BACKENDS[name]).parameters
+    options = {key: value for key, value in options.items() if value is not None}
+    backend = BACKENDS[name](**{key: value for key, value in options.items() if key in parameters})
+    ignored = [key for key, value in options.items() if key not in parameters and value is not False]
+    if ignored:
+        backend.logger.warning(f"The {name} backend does not support {', '.join(ignored)}, ignoring it")
+    return backend
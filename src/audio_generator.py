@@ -1,56 +1,140 @@
+import io
 import random
 import os
-import sys
 import logging
+import threading
 
 from pydub import AudioSegment
 from tqdm import tqdm
 from tqdm.contrib.logging import logging_redirect_tqdm
-import tempfile
 
-from utils.tiktok_tts import tts as tiktok_tts
+from utils.tts_client import TTSClient, TTSUnavailable
+from utils.tts_dispatcher import TTSDispatcher
+from utils import mp3, pcm, subtitles
 from utils.logger import setup_logger
+from utils.metrics import metrics
 from models.post import Post
 from config.structure import AUDIO_DIR
 from config.dicts import TIKTOK_VOICES
 from utils.text import split_text_into_chunks, shorten_hash, shorten_string
 
 class AudioGenerator:
-    def __init__(self, loglevel = logging.INFO):
+    def __init__(self, loglevel = logging.INFO, cache = None, client = None, dispatcher = None, pcm_sidecar = False):
+        """
+        Args:
+            cache (TTSCache, optional): Cache for synthesized chunks; without it, every chunk is requested.
+            client (TTSClient, optional): The TTS client shared by all threads. Defaults to one for tiktok_tts.ENDPOINTS.
+            dispatcher (TTSDispatcher, optional): Queues the chunk requests of all posts under one global limit.
+                                                  Defaults to one around the client.
+            pcm_sidecar (bool): Also store the audio as 16 kHz mono PCM for the Subtitler, see utils/pcm.py.
+        """
         self.logger = setup_logger(__name__, loglevel, emoji='🎵')
         self.output_dir = AUDIO_DIR
+        self.cache = cache
+        self.dispatcher = dispatcher or TTSDispatcher(client or TTSClient(loglevel=loglevel), loglevel=loglevel)
+        self.client = self.dispatcher.client
+        self.pcm_sidecar = pcm_sidecar
+
+    @staticmethod
+    def _reencode(streams, path):
+        """
+        Decode and join chunks of different formats, and encode them once.
+        """
+        segments = [AudioSegment.from_file(io.BytesIO(stream.data), format='mp3') for stream in streams]
+        first = segments[0]
+        raw = b''.join(segment.set_frame_rate(first.frame_rate).set_channels(first.channels).raw_data for segment in segments)
+        first._spawn(raw).export(path, format='mp3')
 
     def from_post(self, post):
         """
-        Generate audio from a post.
+        Generate audio from a post, and record its duration and format on the post.
         
         Args:
             post (Post): The post content to generate audio from.
         
         Returns:
             bool: True if audio generation is successful, False otherwise.
+
+        Raises:
+            TTSUnavailable: If all TTS endpoints are down, which says nothing about the post.
         """
 
-        voice = random.choice(TIKTOK_VOICES)
+        # The same voice for every attempt of a post, so retries can reuse cached chunks
+        voice = random.Random(post.hash).choice(TIKTOK_VOICES)
         texts = [post.title] + split_text_into_chunks(post.content)
 
-        segments = AudioSegment.empty()
+        # Queue every chunk not in the cache right away, so they are requested
+        # concurrently with the chunks of all other posts
+        chunks = []
+        for t in texts:
+            audio = self.cache.get(voice, t) if self.cache else None
+            chunks.append((t, audio, self.dispatcher.submit(t, voice) if audio is None else None))
+
+        streams = []
 
-        with tempfile.TemporaryDirectory() as tmpdirname:
+        try:
+            # Collect the chunks in order, each as soon as it and all before it are done
+            for t, audio, future in chunks:
+                if future is not None:
+                    audio = future.result()
+                    metrics.inc('tts_chunks_total')
+                streams.append(mp3.MP3Frames(audio))
+
+                # Only cache chunks which parsed fine
+                if self.cache and future is not None:
+                    self.cache.put(voice, t, audio)
+
+            audio_path = os.path.join(self.output_dir, f'{post.hash}.mp3')
+            # Unique per process and thread, as several workers may handle the same post
+            tmp_path = f'{audio_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            sidecars = []
+            committed = False
             try:
-                for i, t in enumerate(texts):
-                    filename = os.path.join(tmpdirname, f"{i}out.mp3")
-
-                    sys.stdout = open(os.devnull, 'w') # block tiktok_tts print() spam
-                    tiktok_tts(t, voice, filename, play_sound=False)
-                    sys.stdout = sys.__stdout__ # restore printing
-
-                    segments += AudioSegment.from_file(filename, format='mp3')
-
-                audio_path = os.path.join(self.output_dir, f'{post.hash}.mp3')
-                segments.export(audio_path)
-                self.logger.debug(f"Generated audio for post {post.short_hash}")
-                return True
-            except Exception as e:
-                self.logger.error(f"Failed to generate audio for post {post.short_hash}: {e}")
-                return False
+                try:
+                    data = mp3.concat(streams)
+                except ValueError as e:
+                    self.logger.debug(f"Re-encoding audio for post {post.short_hash}: {e}")
+                    self._reencode(streams, tmp_path)
+                    with open(tmp_path, 'rb') as file:
+                        data = file.read()
+                else:
+                    with open(tmp_path, 'wb') as file:
+                        file.write(data)
+
+                if self.pcm_sidecar:
+                    sidecars.append(pcm.sidecar_path(post.hash))
+                    with metrics.timer('ffmpeg_seconds', step='pcm'):
+                        pcm.save(sidecars[-1], pcm.decode(data))
+
+                # Lets the subtitle stage lay out the known text instead of transcribing it
+                sidecars.append(subtitles.timings_path(post.hash))
+                subtitles.save_timings(sidecars[-1], [(t, stream.duration) for t, stream in zip(texts, streams)])
+
+                # Later stages never see a partially written file
+                os.replace(tmp_path, audio_path)
+                committed = True
+            finally:
+                if not committed:
+                    # Leave nothing behind of an audio which was not stored
+                    for path in (tmp_path, *sidecars):
+                        if os.path.isfile(path):
+                            os.remove(path)
+
+            post.audio_duration = sum(stream.duration for stream in streams)
+            post.audio_sample_rate = streams[0].sample_rate
+            post.audio_channels = streams[0].channels
+
+            metrics.add_file_bytes(audio_path, stage='audio')
+            self.logger.debug(f"Generated audio for post {post.short_hash}")
+            return True
+        except Exception as e:
+            # Do not spend requests on the rest of a post which failed anyway
+            for _, _, future in chunks:
+                if future is not None:
+                    future.cancel()
+            metrics.inc('failures_total', stage='audio', reason=type(e).__name__)
+            self.logger.error(f"Failed to generate audio for post {post.short_hash}: {e}")
+            if isinstance(e, TTSUnavailable):
+                # Keep the post for when the endpoints are back
+                raise
+            return False
@@ -1,9 +1,11 @@
+import functools
 import logging
 import subprocess
 import random
 import os
 
 from utils.logger import setup_logger
+from utils.metrics import metrics
 from config.structure import AUDIO_DIR, SUBTITLE_DIR, VIDEO_DIR, BACKGROUNDS_DIR, FONT
 from utils.text import shorten_hash
 
@@ -11,26 +13,49 @@ def get_duration(file):
     cmd = ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'default=noprint_wrappers=1:nokey=1', file]
     return float(subprocess.check_output(cmd))
 
+# Background videos do not change, so each one is only probed once
+get_background_duration = functools.lru_cache(maxsize=None)(get_duration)
+
 class Composer:
-    def __init__(self, loglevel = logging.INFO):
+    def __init__(self, loglevel = logging.INFO, hwaccel = 'cuda', video_codec = 'h264_nvenc'):
+        """
+        Args:
+            hwaccel (str, optional): ffmpeg's hardware decoding method, None to decode on the CPU.
+            video_codec (str): The video encoder, e.g. 'libx264' to encode on the CPU.
+        """
         self.logger = setup_logger(__name__, loglevel, emoji='🎥')
+        self.hwaccel = hwaccel
+        self.video_codec = video_codec
+
+    def _ffmpeg(self, step, cmd):
+        """
+        Run an ffmpeg command with the configured hardware decoding.
+
+        Raises:
+            subprocess.CalledProcessError: If ffmpeg failed.
+        """
+        hwaccel = ['-hwaccel', self.hwaccel] if self.hwaccel else []
+        with metrics.timer('ffmpeg_seconds', step=step):
+            subprocess.run(cmd[:1] + hwaccel + cmd[1:], check=True)
 
     def from_post(self, post):
         if post.video:
             self.logger.debug(f"Skipping video generation for post {post.short_hash} because it already has a video")
             return True
         elif post.audio and post.subtitles:
-            return self.from_hash(post.hash)
+            return self.from_hash(post.hash, audio_duration=getattr(post, 'audio_duration', None))
         else:
             self.logger.debug(f"Skipping video generation for post {post.short_hash} because it has no audio or subtitles")
             return False
 
-    def from_hash(self, hash):
+    def from_hash(self, hash, audio_duration=None):
         """
         Generate a video from a post hash.
 
         Args:
             hash (str): The hash of the post to generate a video from.
+            audio_duration (float, optional): The length of the post's audio as recorded by the audio stage.
+                                              Probed from the file if unknown.
         
         Returns:
             bool: True if video generation is successful, False otherwise.
@@ -43,8 +68,9 @@ class Composer:
             background_content_dir = os.path.join(BACKGROUNDS_DIR, random.choice([dir for dir in os.listdir(BACKGROUNDS_DIR) if os.path.isdir(os.path.join(BACKGROUNDS_DIR, dir))]))
             video_path = os.path.join(background_content_dir, random.choice([f for f in os.listdir(background_content_dir) if f.endswith('.mp4')]))
 
-            audio_duration = get_duration(audio_path)
-            video_duration = get_duration(video_path)
+            if audio_duration is None:
+                audio_duration = get_duration(audio_path)
+            video_duration = get_background_duration(video_path)
 
             # Calculate the maximum start time to ensure the remaining duration is sufficient for the voice-over
             max_start_time = int(video_duration - audio_duration)
@@ -56,18 +82,17 @@ class Composer:
             cmd = ['ffmpeg', 
                  '-loglevel', ffmpeg_loglevel,
                  '-threads', 'auto',
-                 '-hwaccel', 'cuda', #CUDA processing on NVIDA GPU
                  '-i', video_path, 
                  '-i', audio_path, 
                  '-filter_complex', f"[0:v]trim=start={start_time}:duration={audio_duration},setpts=PTS-STARTPTS[v0];[1:a]atrim=start=0:duration={audio_duration},asetpts=PTS-STARTPTS[a0]", 
                  '-map', "[v0]", 
                  '-map', "[a0]", 
-                 '-c:v', 'h264_nvenc', 
+                 '-c:v', self.video_codec, 
                  '-c:a', 'aac', 
                  '-strict', 'experimental', 
                  composed_output_file
                 ]
-            subprocess.run(cmd)
+            self._ffmpeg('compose', cmd)
 
             self.logger.debug(f"Composed AV - {shorten_hash(hash)}")
 
@@ -76,17 +101,17 @@ class Composer:
             cmd = ['ffmpeg', 
                 '-loglevel', ffmpeg_loglevel,
                 '-threads', 'auto',
-                '-hwaccel', 'cuda',
                 '-i', composed_output_file, 
                 '-vf', f"subtitles={subtitle_path}:force_style='Fontfile={FONT['PATH']},Fontname={FONT['NAME']},Fontsize={str(FONT['SIZE'])},MarginV=100,Alignment=6,PrimaryColor=&H00FFFFFF,OutlineColor=&H00FFFFFF'", 
-                '-c:v', 'h264_nvenc',
+                '-c:v', self.video_codec,
                 '-c:a', 'copy', 
                 composed_subtitled_output_file
                 ]
-            subprocess.run(cmd)
+            self._ffmpeg('subtitles', cmd)
 
             self.logger.debug(f"Burned subtitles - {shorten_hash(hash)}")
 
+            metrics.add_file_bytes(composed_subtitled_output_file, stage='video')
             os.remove(composed_output_file)
 
             # Split into 60 (50 for safety) Second parts for shorts
@@ -96,7 +121,6 @@ class Composer:
             composed_subtitled_output_part_file = os.path.join(parts_dir, f'%03d.mp4')
             cmd = ['ffmpeg', 
                    '-loglevel', ffmpeg_loglevel,
-                   '-hwaccel', 'cuda',
                    '-threads', 'auto',
                    '-i', composed_subtitled_output_file, 
                    '-c', 'copy', 
@@ -104,9 +128,10 @@ class Composer:
                    '-segment_time', '50', 
                    '-reset_timestamps', '1', 
                    composed_subtitled_output_part_file]
-            subprocess.run(cmd)
+            self._ffmpeg('split', cmd)
 
         except Exception as e:
+            metrics.inc('failures_total', stage='video', reason=type(e).__name__)
             self.logger.error(f"Failed to generate video for post {shorten_hash(hash)}: {e}")
             return False
 
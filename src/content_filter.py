@@ -0,0 +1,91 @@
+import logging
+
+from config.dicts import BAD_WORDS, CONTENT_RULES
+from utils.keywords import KeywordMatcher
+from utils.logger import setup_logger
+from utils.text import shorten_string
+from utils.metrics import metrics
+
+class ContentFilter:
+    """
+    Decides at crawl time whether a post is worth turning into a video.
+
+    Posts containing a bad word, or whose text or estimated narration is too
+    short or too long, are rejected before a Post is even constructed, so they
+    never reach the DB, TTS, whisper or ffmpeg.
+    """
+    def __init__(self, bad_words=BAD_WORDS, min_length=None, max_length=None,
+                 min_duration=None, max_duration=None, words_per_minute=None, loglevel = logging.INFO):
+        """
+        Args:
+            bad_words (iterable): Posts with a word starting with any of these are rejected.
+            min_length (int, optional): The minimum number of characters of title and content.
+            max_length (int, optional): The maximum number of characters of title and content.
+            min_duration (float, optional): The minimum estimated narration length in seconds.
+            max_duration (float, optional): The maximum estimated narration length in seconds.
+            words_per_minute (float, optional): The TTS speaking rate used for the estimate.
+
+        Rules default to CONTENT_RULES in config/dicts.py; a rule set to None is not enforced.
+        """
+        self.logger = setup_logger(__name__, loglevel, emoji='🚦')
+        self.matcher = KeywordMatcher(bad_words)
+
+        rules = dict(CONTENT_RULES)
+        for name, value in (('min_length', min_length), ('max_length', max_length), ('min_duration', min_duration),
+                            ('max_duration', max_duration), ('words_per_minute', words_per_minute)):
+            if value is not None:
+                rules[name] = value
+        self.min_length = rules.get('min_length')
+        self.max_length = rules.get('max_length')
+        self.min_duration = rules.get('min_duration')
+        self.max_duration = rules.get('max_duration')
+        self.words_per_minute = rules.get('words_per_minute') or 160
+
+    def estimate_duration(self, title, content):
+        """
+        Returns:
+            float: The estimated narration length of title and content in seconds.
+        """
+        words = len(title.split()) + len(content.split())
+        return words / self.words_per_minute * 60
+
+    def check(self, title, content):
+        """
+        Apply all rules to the raw title and content of a post.
+
+        Returns:
+            tuple: The violated rule and a description of why, or None if the post passes.
+        """
+        length = len(title) + len(content)
+        if self.min_length is not None and length < self.min_length:
+            return 'min_length', f"{length} characters"
+        if self.max_length is not None and length > self.max_length:
+            return 'max_length', f"{length} characters"
+
+        if self.min_duration is not None or self.max_duration is not None:
+            duration = self.estimate_duration(title, content)
+            if self.min_duration is not None and duration < self.min_duration:
+                return 'min_duration', f"about {duration:.0f}s of narration"
+            if self.max_duration is not None and duration > self.max_duration:
+                return 'max_duration', f"about {duration:.0f}s of narration"
+
+        if self.matcher:
+            word = self.matcher.find(title + '\n' + content)
+            if word is not None:
+                return 'bad_words', f"contains '{word}'"
+        return None
+
+    def accepts(self, title, content, subreddit=None):
+        """
+        Check a post and record a rejection.
+
+        Returns:
+            bool: Whether the post passes all rules.
+        """
+        rejection = self.check(title, content)
+        if rejection is None:
+            return True
+        rule, reason = rejection
+        metrics.inc('crawl_rejected_total', rule=rule, subreddit=subreddit)
+        self.logger.debug(f"Rejected post '{shorten_string(title)}' from {subreddit} by {rule}: {reason}")
+        return False
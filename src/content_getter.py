@@ -2,17 +2,131 @@ import feedparser
 import logging
 import time
 import requests
+import concurrent.futures
+import hashlib
+
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
 
-from bs4 import BeautifulSoup
 from tqdm import tqdm
 
 from config.dicts import SUBREDDITS
 from utils.logger import setup_logger
+from utils.metrics import metrics
+from utils.ratelimit import RateLimiter
+from utils.html_parser import get_parser
 from models.post import Post
 
+REDDIT_URL = 'https://reddit.com'
+# Reddit throttles the generic User-Agents of HTTP libraries hardest
+USER_AGENT = 'python:vidgen:1.0 (+https://github.com/janmartchouk/vidgen)'
+
 class ContentGetter:
-    def __init__(self, loglevel = logging.INFO):
+    def __init__(self, loglevel = logging.INFO, base_url = REDDIT_URL, max_workers = 8, rate_limit = 5.0, timeout = 30, feed_cache = None, parser = None, content_filter = None):
+        """
+        Args:
+            base_url (str): The Reddit URL to crawl, without trailing slash.
+            max_workers (int): The number of feeds crawl() fetches at once.
+            rate_limit (float): The maximum requests per second per host, or 0 for no limit.
+            timeout (float): Seconds to wait for a server to answer a request.
+            feed_cache (FeedCache, optional): Cache for conditional GETs; without it, every feed is fully fetched and parsed.
+            parser (str, optional): The HTML parser backend, see utils/html_parser.py. Defaults to the fastest installed one.
+            content_filter (ContentFilter, optional): Rejects unsuitable posts before they are built; without it, every post is kept.
+        """
         self.logger = setup_logger(__name__, loglevel, emoji='🌍')
+        self.base_url = base_url.rstrip('/')
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.feed_cache = feed_cache
+        self.parser = get_parser(parser)
+        self.content_filter = content_filter
+        self.logger.debug(f"Using the {self.parser.name} HTML parser")
+
+        # One keep-alive connection pool shared by all feeds and threads
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.session.headers['User-Agent'] = USER_AGENT
+        self.rate_limiter = RateLimiter(rate_limit)
+
+    def _get(self, url, **kwargs):
+        """
+        GET a URL through the shared session, respecting the per-host rate limit.
+        """
+        self.rate_limiter.wait(urlparse(url).netloc)
+        kwargs.setdefault('timeout', self.timeout)
+        return self.session.get(url, **kwargs)
+
+    def _fetch_feed(self, url, subreddit, method):
+        """
+        Fetch a feed, with a conditional GET if a feed cache is configured.
+
+        Returns:
+            dict: The 'content' of the response, the 'seen' entry keys of the previous
+                  response and the validators to cache, or None if the feed is unchanged.
+        """
+        headers = self.feed_cache.request_headers(url) if self.feed_cache else {}
+        with metrics.timer('crawl_fetch_seconds', subreddit=subreddit, method=method):
+            response = self._get(url, headers=headers)
+
+        if response.status_code == 304:
+            metrics.inc('crawl_not_modified_total', subreddit=subreddit)
+            self.logger.debug(f"{subreddit} feed not modified")
+            return None
+        if not response.ok:
+            self.logger.warning(f"Fetching {subreddit} feed returned HTTP {response.status_code}")
+
+        feed = {'content': response.content, 'seen': set()}
+        if self.feed_cache and response.ok:
+            cached = self.feed_cache.get(url)
+            feed['digest'] = hashlib.sha256(response.content).hexdigest()
+            if feed['digest'] == cached.get('digest'):
+                # The server ignored the validators, but nothing changed
+                metrics.inc('crawl_not_modified_total', subreddit=subreddit)
+                self.logger.debug(f"{subreddit} feed unchanged")
+                return None
+            feed['seen'] = set(cached.get('seen', []))
+            feed['etag'] = response.headers.get('ETag')
+            feed['last_modified'] = response.headers.get('Last-Modified')
+        return feed
+
+    def _remember_feed(self, url, feed, keys, failed_number=0):
+        """
+        Store the validators of a fetched feed and the keys of its processed entries in the feed cache.
+
+        If entries failed, only the keys are stored, so the next crawl fetches the whole feed
+        again and retries them instead of skipping it as unchanged.
+        """
+        if self.feed_cache and 'digest' in feed:
+            if failed_number:
+                self.feed_cache.update(url, None, None, None, keys)
+            else:
+                self.feed_cache.update(url, feed['etag'], feed['last_modified'], feed['digest'], keys)
+
+    def crawl(self, subreddits):
+        """
+        Fetch the Posts of several subreddits concurrently.
+
+        Args:
+            subreddits (iterable): The subreddits to crawl, each configured in SUBREDDITS.
+
+        Yields:
+            tuple: (subreddit, list of Posts), as soon as each feed has been fetched and parsed.
+        """
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            futures = {executor.submit(self.from_subreddit, subreddit): subreddit for subreddit in subreddits}
+            for future in concurrent.futures.as_completed(futures):
+                subreddit = futures[future]
+                try:
+                    yield subreddit, future.result()
+                except Exception as e:
+                    metrics.inc('failures_total', stage='crawl', reason=type(e).__name__)
+                    self.logger.error(f"Failed to crawl {subreddit}: {e}")
+        finally:
+            # If the caller stops early, don't wait for feeds it no longer wants
+            executor.shutdown(wait=False, cancel_futures=True)
 
     # Get a list of Reddit Posts from an RSS feed
     def from_subreddit(self, subreddit):
@@ -29,46 +143,95 @@ class ContentGetter:
             exit(1)
 
     def from_rss_subreddit(self, subreddit):
-        data = feedparser.parse(f'https://reddit.com/r/{subreddit}/top.rss')
+        url = f'{self.base_url}/r/{subreddit}/top.rss'
+        feed = self._fetch_feed(url, subreddit, 'rss')
+        if feed is None:
+            self.logger.info(f"RSS feed of {subreddit} unchanged, skipping")
+            return []
+
+        data = feedparser.parse(feed['content'])
         posts = []
+        keys = set()
         failed_number = 0
-        if data.entries:
+        skipped_number = 0
+        rejected_number = 0
+        for entry in data.entries:
             try:
-                for entry in data.entries:
-                    paragraphs = BeautifulSoup(entry.content[0].value, 'html.parser').find_all('p')
-                    content = ''.join([p.get_text() for p in paragraphs])
-                    post_obj = Post(
-                        title=entry.title,
-                        author=entry.authors[0].name,
-                        subreddit=subreddit,
-                        content=content,
-                        crawl_date=time.time()
-                    )
-                    posts.append(post_obj)
-                    self.logger.debug(f"RSS crawled the post {post_obj.short_hash}")
+                key = entry.get('id') or entry.title
+                if key in feed['seen']:
+                    keys.add(key)
+                    skipped_number += 1
+                    continue
+
+                content = self.parser.paragraph_text(entry.content[0].value)
+                if self.content_filter and not self.content_filter.accepts(entry.title, content, subreddit):
+                    keys.add(key)
+                    rejected_number += 1
+                    continue
+
+                post_obj = Post(
+                    title=entry.title,
+                    author=entry.authors[0].name,
+                    subreddit=subreddit,
+                    content=content,
+                    crawl_date=time.time()
+                )
+                posts.append(post_obj)
+                # Only processed entries count as seen, so failed ones are retried
+                keys.add(key)
+                self.logger.debug(f"RSS crawled the post {post_obj.short_hash}")
             except Exception as e:
                 failed_number += 1
+                metrics.inc('failures_total', stage='crawl', reason=type(e).__name__)
                 self.logger.debug(f"Continuing, but encountered an error parsing RSS feed: {e}")
-        self.logger.info(f"RSS crawled {len(posts)} posts from {subreddit} ({failed_number} failed)")
+        self._remember_feed(url, feed, keys, failed_number)
+        metrics.inc('crawl_posts_total', len(posts), subreddit=subreddit)
+        self.logger.info(f"RSS crawled {len(posts)} posts from {subreddit} ({failed_number} failed, {skipped_number} seen before, {rejected_number} rejected)")
         return posts
     
     def from_web(self, subreddit):
-        soup = BeautifulSoup(requests.get(f'https://reddit.com/r/{subreddit}/top').content, 'html.parser')
+        url = f'{self.base_url}/r/{subreddit}/top'
+        feed = self._fetch_feed(url, subreddit, 'web')
+        if feed is None:
+            self.logger.info(f"Web feed of {subreddit} unchanged, skipping")
+            return []
+
         posts = []
+        keys = set()
         failed_number = 0
-        for post in soup.find_all('shreddit-post'):
+        skipped_number = 0
+        rejected_number = 0
+        for fields in self.parser.web_posts(feed['content']):
             try:
+                if fields['title'] is None or fields['author'] is None or fields['content'] is None:
+                    raise ValueError(f"incomplete post element {fields['id']}")
+                key = fields['id'] or fields['title']
+                if key in feed['seen']:
+                    keys.add(key)
+                    skipped_number += 1
+                    continue
+
+                if self.content_filter and not self.content_filter.accepts(fields['title'], fields['content'], subreddit):
+                    keys.add(key)
+                    rejected_number += 1
+                    continue
+
                 post_obj = Post(
-                    title=post.find('a', id=lambda x: x and 'post-title' in x).text,
-                    author=post.find('span', {'slot': 'authorName'}).text,
+                    title=fields['title'],
+                    author=fields['author'],
                     subreddit=subreddit,
-                    content=post.find('div', id=lambda x: x and 'post-rtjson-content' in x).text,
+                    content=fields['content'],
                     crawl_date=time.time()
                 )
                 posts.append(post_obj)
+                # Only processed entries count as seen, so failed ones are retried
+                keys.add(key)
                 self.logger.debug(f"Web crawled the post {post_obj.short_hash}")
             except Exception as e:
                 failed_number += 1
+                metrics.inc('failures_total', stage='crawl', reason=type(e).__name__)
                 self.logger.debug(f"Continuing, but encountered an error parsing web feed: {e}")
-        self.logger.info(f"Web crawled {len(posts)} posts from {subreddit} ({failed_number} failed)")
-        return posts
\ No newline at end of file
+        self._remember_feed(url, feed, keys, failed_number)
+        metrics.inc('crawl_posts_total', len(posts), subreddit=subreddit)
+        self.logger.info(f"Web crawled {len(posts)} posts from {subreddit} ({failed_number} failed, {skipped_number} seen before, {rejected_number} rejected)")
+        return posts
@@ -1,13 +1,118 @@
 import sqlite3
 import pickle
 import logging
+import json
 import os
+import time
+import threading
+
+from contextlib import contextmanager
 
 from config import structure
 from utils.logger import setup_logger
+from utils.text import shorten_hash
 from models.post import Post
 
+# Columns of the posts table, in storage order
+POST_COLUMNS = (
+    'hash',
+    'title',
+    'author',
+    'subreddit',
+    'content',
+    'crawl_date',
+    'audio',
+    'subtitles',
+    'video',
+    'uploaded_youtube',
+    'posted_to',
+    'audio_duration',
+    'audio_sample_rate',
+    'audio_channels',
+)
+COLUMNS_SQL = ', '.join(POST_COLUMNS)
+INSERT_SQL = f"INSERT INTO posts ({COLUMNS_SQL}) VALUES ({', '.join('?' * len(POST_COLUMNS))})"
+INSERT_OR_IGNORE_SQL = INSERT_SQL.replace('INSERT', 'INSERT OR IGNORE', 1)
+UPDATE_SQL = f"UPDATE posts SET {', '.join(f'{col}=?' for col in POST_COLUMNS[1:])} WHERE hash=?"
+
+# Stage flags which can be set without rewriting the whole row
+FLAG_COLUMNS = ('audio', 'subtitles', 'video', 'uploaded_youtube')
+
+# Metadata a stage records on the Post, stored together with its flag
+STAGE_COLUMNS = {
+    'audio': ('audio_duration', 'audio_sample_rate', 'audio_channels'),
+}
+
+# Columns added after the columnar schema was introduced, with their definitions
+ADDED_COLUMNS = {
+    'audio_duration': 'real',
+    'audio_sample_rate': 'integer',
+    'audio_channels': 'integer',
+}
+
+# WHERE clauses selecting the Posts each pipeline stage still has to work on.
+# Each one is backed by a partial index, see DB._create_schema()
+NEEDS_AUDIO = "audio = 0"
+NEEDS_SUBTITLES = "audio = 1 AND subtitles = 0"
+NEEDS_VIDEO = "audio = 1 AND subtitles = 1 AND video = 0"
+
+def post_to_row(post: Post):
+    """
+    Convert a Post object into a tuple matching POST_COLUMNS.
+
+    :param post: The Post object to convert.
+    :return: A tuple of column values.
+    """
+    return (
+        post.hash,
+        post.title,
+        post.author,
+        post.subreddit,
+        post.content,
+        # Never NULL, see DB._migrate_paging_key()
+        post.crawl_date if post.crawl_date is not None else 0,
+        int(bool(post.audio)),
+        int(bool(post.subtitles)),
+        int(bool(post.video)),
+        int(bool(getattr(post, 'uploaded_youtube', False))),
+        json.dumps(getattr(post, 'posted_to', [])),
+        getattr(post, 'audio_duration', None),
+        getattr(post, 'audio_sample_rate', None),
+        getattr(post, 'audio_channels', None),
+    )
+
+def row_to_post(row):
+    """
+    Convert a row selected with POST_COLUMNS back into a Post object.
+
+    :param row: A tuple of column values.
+    :return: The Post object.
+    """
+    data = dict(zip(POST_COLUMNS, row))
+    data['posted_to'] = json.loads(data['posted_to'] or '[]')
+    return Post.from_dict(data)
+
+class PostRecord:
+    """
+    A partial view of a stored Post, holding only the columns it was selected with.
+
+    Use DB.get_post_by_hash() to load the full Post when its content is needed.
+    """
+    def __init__(self, **fields):
+        for col in FLAG_COLUMNS:
+            if col in fields:
+                fields[col] = bool(fields[col])
+        self.__dict__.update(fields)
+        self.short_hash = shorten_hash(self.hash)
+
 class DB:
+    """
+    Access to the posts database, safe to share between threads.
+
+    All writes go through a single writer connection guarded by a lock, so
+    they are serialized. Reads use one connection per thread, which WAL mode
+    lets run alongside the writer.
+    """
     def __init__(self, loglevel = logging.INFO):
         self.logger = setup_logger(__name__, loglevel, emoji='📚')
 
@@ -19,22 +124,338 @@ class DB:
             self.logger.info("DB_PATH does not exist, creating")
             open(structure.DB_PATH, 'w').close()
 
-        self.conn = sqlite3.connect(structure.DB_PATH)
+        self.path = structure.DB_PATH
+
+        # The writer connection is used from every thread, but only while holding the lock
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
         self.c = self.conn.cursor()
 
-        self.c.execute("CREATE TABLE IF NOT EXISTS posts (hash text, data blob)")
+        # WAL lets readers run alongside the writer, and with synchronous=NORMAL
+        # a commit no longer fsyncs; the WAL is only synced at checkpoints
+        self.c.execute("PRAGMA journal_mode=WAL")
+        self.c.execute("PRAGMA synchronous=NORMAL")
+
+        # Per-thread reader connections, see _read_conn()
+        self._local = threading.local()
+        self._readers = []
+
+        # State of the currently running transaction(), if any
+        self._batch_depth = 0
+        self._batch_size = 0
+        self._batch_interval = 0
+        self._pending = 0
+        self._last_flush = 0
+
+        self._migrate_legacy()
+        self._create_schema()
+        self.conn.commit()
 
         self.logger.info("Connected to DB")
-    
-    def __del__(self): 
+
+    def __del__(self):
         self.close()
 
     def close(self):
         if self.conn:
-            self.conn.commit()
-            self.conn.close()
+            with self.lock:
+                for reader in self._readers:
+                    reader.close()
+                self._readers = []
+                self.conn.commit()
+                self.conn.close()
+                self.conn = None
             self.logger.info("DB connection closed")
 
+    def _thread_conn(self):
+        """
+        Get the read-only connection of the calling thread, opening it on first use.
+
+        :return: A sqlite3 connection.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA query_only=ON")
+            self._local.conn = conn
+            with self.lock:
+                self._readers.append(conn)
+        return conn
+
+    @contextmanager
+    def _read_conn(self):
+        """
+        Get a connection to read from.
+
+        This is the calling thread's own connection, unless a transaction() holds
+        writes which were not committed yet. Then reads go through the writer, so
+        they see those writes.
+
+        :return: A context manager yielding a sqlite3 connection.
+        """
+        self.lock.acquire()
+        if self._pending:
+            try:
+                yield self.conn
+            finally:
+                self.lock.release()
+            return
+        self.lock.release()
+        yield self._thread_conn()
+
+    def _commit(self, count=1):
+        """
+        Commit pending writes, or leave them to the running transaction().
+        Must be called while holding the lock.
+
+        :param count: The number of rows written since the last call.
+        """
+        if not self._batch_depth:
+            self.conn.commit()
+            return
+
+        self._pending += count
+        if self._pending >= self._batch_size or time.monotonic() - self._last_flush >= self._batch_interval:
+            self.flush()
+
+    def flush(self):
+        """
+        Commit all pending writes now.
+        """
+        with self.lock:
+            if self._pending:
+                self.logger.debug(f"Flushing {self._pending} pending writes")
+            self.conn.commit()
+            self._pending = 0
+            self._last_flush = time.monotonic()
+
+    @contextmanager
+    def transaction(self, batch_size=500, batch_interval=5.0):
+        """
+        Group writes into few commits instead of one commit per write.
+
+        Inside the block, insert/update/delete calls from any thread are committed
+        together once batch_size rows are pending or batch_interval seconds have
+        passed since the last flush, and once more when the last open block exits.
+        If a block raises, writes which were not flushed yet are rolled back.
+        Nested blocks join the outermost one.
+
+        :param batch_size: The number of pending rows which triggers a commit.
+        :param batch_interval: The number of seconds after which pending rows are committed.
+        """
+        with self.lock:
+            if not self._batch_depth:
+                self._batch_size = batch_size
+                self._batch_interval = batch_interval
+                self._pending = 0
+                self._last_flush = time.monotonic()
+            self._batch_depth += 1
+
+        try:
+            yield self
+        except BaseException:
+            with self.lock:
+                self.logger.debug(f"Rolling back {self._pending} pending writes")
+                self.conn.rollback()
+                self._pending = 0
+            raise
+        finally:
+            with self.lock:
+                self._batch_depth -= 1
+                if not self._batch_depth:
+                    self.flush()
+
+    def _create_schema(self):
+        """
+        Create the posts table and the per-stage partial indexes if they do not exist yet.
+        """
+        self.c.execute("""CREATE TABLE IF NOT EXISTS posts (
+            hash text PRIMARY KEY,
+            title text NOT NULL,
+            author text NOT NULL,
+            subreddit text NOT NULL,
+            content text NOT NULL,
+            crawl_date real,
+            audio integer NOT NULL DEFAULT 0,
+            subtitles integer NOT NULL DEFAULT 0,
+            video integer NOT NULL DEFAULT 0,
+            uploaded_youtube integer NOT NULL DEFAULT 0,
+            posted_to text NOT NULL DEFAULT '[]',
+            audio_duration real,
+            audio_sample_rate integer,
+            audio_channels integer
+        )""")
+        self._add_missing_columns()
+        self._migrate_paging_key()
+        # (crawl_date, hash) is the paging key of iter_posts()
+        self.c.execute("CREATE INDEX IF NOT EXISTS posts_crawl_date ON posts (crawl_date, hash)")
+        self.c.execute(f"CREATE INDEX IF NOT EXISTS posts_needs_audio ON posts (crawl_date, hash) WHERE {NEEDS_AUDIO}")
+        self.c.execute(f"CREATE INDEX IF NOT EXISTS posts_needs_subtitles ON posts (crawl_date, hash) WHERE {NEEDS_SUBTITLES}")
+        self.c.execute(f"CREATE INDEX IF NOT EXISTS posts_needs_video ON posts (crawl_date, hash) WHERE {NEEDS_VIDEO}")
+
+    def _migrate_paging_key(self):
+        """
+        Prepare a posts table created before iter_posts() paged on (crawl_date, hash).
+
+        A NULL crawl_date never compares greater than a paging key, so such rows would be
+        skipped; they are set to 0, as post_to_row() stores them. The stage indexes of that
+        schema only covered crawl_date and are rebuilt on (crawl_date, hash).
+        """
+        self.c.execute("UPDATE posts SET crawl_date = 0 WHERE crawl_date IS NULL")
+        for index in ('posts_needs_audio', 'posts_needs_subtitles', 'posts_needs_video'):
+            columns = [row[2] for row in self.c.execute(f"PRAGMA index_info({index})").fetchall()]
+            if columns and columns != ['crawl_date', 'hash']:
+                self.logger.info(f"Rebuilding index {index} on (crawl_date, hash)")
+                self.c.execute(f"DROP INDEX {index}")
+
+    def _add_missing_columns(self):
+        """
+        Add the columns of ADDED_COLUMNS to a posts table created before they existed.
+        """
+        columns = {row[1] for row in self.c.execute("PRAGMA table_info(posts)").fetchall()}
+        for column, definition in ADDED_COLUMNS.items():
+            if column not in columns:
+                self.logger.info(f"Adding column {column} to posts")
+                self.c.execute(f"ALTER TABLE posts ADD COLUMN {column} {definition}")
+
+    def _migrate_legacy(self):
+        """
+        Convert a legacy `posts (hash, data)` table of pickled Posts into the columnar schema.
+
+        The conversion runs in a single transaction, so an interrupted migration leaves the legacy table untouched.
+        """
+        columns = [row[1] for row in self.c.execute("PRAGMA table_info(posts)").fetchall()]
+        if columns != ['hash', 'data']:
+            return
+
+        self.logger.info("Migrating legacy pickle DB to columnar schema")
+
+        try:
+            self.c.execute("BEGIN")
+            self.c.execute("ALTER TABLE posts RENAME TO posts_legacy")
+            self._create_schema()
+
+            read = self.conn.cursor()
+            read.execute("SELECT data FROM posts_legacy")
+            migrated = 0
+            while True:
+                batch = read.fetchmany(500)
+                if not batch:
+                    break
+                rows = [post_to_row(pickle.loads(data)) for (data,) in batch]
+                self.c.executemany(INSERT_OR_IGNORE_SQL, rows)
+                migrated += len(rows)
+
+            self.c.execute("DROP TABLE posts_legacy")
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            self.logger.error("Failed to migrate legacy DB, leaving it untouched")
+            raise
+
+        self.logger.info(f"Migrated {migrated} legacy posts")
+
+    def _build_where(self, where, params, filters):
+        """
+        Combine an SQL condition and column equality filters into one WHERE body.
+
+        :param where: An SQL condition on the posts table, or None.
+        :param params: Parameters for the condition.
+        :param filters: A dict of column names to required values.
+        :return: A tuple of (list of conditions, tuple of parameters).
+        """
+        conditions = [f"({where})"] if where else []
+        for col in filters:
+            if col not in POST_COLUMNS:
+                raise ValueError(f"Unknown column {col}")
+            conditions.append(f"{col}=?")
+        return conditions, (*params, *filters.values())
+
+    def iter_posts(self, where=None, params=(), columns=None, page_size=500, limit=None, **filters):
+        """
+        Lazily iterate over stored Posts, one page of rows at a time.
+
+        Pages are fetched with keyset pagination on (crawl_date, hash), so only one
+        page is held in memory and the table may be written to while iterating.
+
+        :param where: An SQL condition on the posts table (such as NEEDS_AUDIO), or None for all posts.
+        :param params: Parameters for the condition.
+        :param columns: Columns to select. If given, PostRecord objects holding only these
+                        columns (plus hash and crawl_date) are yielded instead of full Posts.
+        :param page_size: The number of rows fetched per query.
+        :param limit: The maximum number of posts to yield, or None for no limit.
+        :param filters: Column equality filters, e.g. subreddit='tifu'.
+        :return: A generator of Post or PostRecord objects.
+        """
+        if columns is None:
+            selected = POST_COLUMNS
+        else:
+            unknown = set(columns) - set(POST_COLUMNS)
+            if unknown:
+                raise ValueError(f"Unknown columns {', '.join(sorted(unknown))}")
+            selected = ('hash', 'crawl_date', *(col for col in columns if col not in ('hash', 'crawl_date')))
+
+        conditions, params = self._build_where(where, params, filters)
+        hash_index, date_index = selected.index('hash'), selected.index('crawl_date')
+
+        last_key = None
+        remaining = limit
+        while remaining is None or remaining > 0:
+            page_conditions = conditions + ["(crawl_date, hash) > (?, ?)"] if last_key else conditions
+            query = f"SELECT {', '.join(selected)} FROM posts"
+            if page_conditions:
+                query += f" WHERE {' AND '.join(page_conditions)}"
+            query += " ORDER BY crawl_date, hash LIMIT ?"
+
+            count = page_size if remaining is None else min(page_size, remaining)
+            with self._read_conn() as conn:
+                rows = conn.execute(query, (*params, *(last_key or ()), count)).fetchall()
+
+            for row in rows:
+                if columns is None:
+                    yield row_to_post(row)
+                else:
+                    yield PostRecord(**dict(zip(selected, row)))
+
+            if len(rows) < count:
+                return
+            last_key = (rows[-1][date_index], rows[-1][hash_index])
+            if remaining is not None:
+                remaining -= len(rows)
+
+    def iter_hashes(self, page_size=5000):
+        """
+        Iterate over the hashes of all stored Posts, reading only the primary key index.
+
+        :param page_size: The number of hashes fetched per query.
+        :return: A generator of hash strings.
+        """
+        last_hash = ''
+        while True:
+            with self._read_conn() as conn:
+                rows = conn.execute("SELECT hash FROM posts WHERE hash > ? ORDER BY hash LIMIT ?", (last_hash, page_size)).fetchall()
+            for (hash,) in rows:
+                yield hash
+            if len(rows) < page_size:
+                return
+            last_hash = rows[-1][0]
+
+    def count_posts(self, where=None, params=(), **filters):
+        """
+        Count the stored Posts matching a condition.
+
+        :param where: An SQL condition on the posts table, or None for all posts.
+        :param params: Parameters for the condition.
+        :param filters: Column equality filters, e.g. subreddit='tifu'.
+        :return: The number of matching posts.
+        """
+        conditions, params = self._build_where(where, params, filters)
+        query = "SELECT COUNT(*) FROM posts"
+        if conditions:
+            query += f" WHERE {' AND '.join(conditions)}"
+        with self._read_conn() as conn:
+            return conn.execute(query, params).fetchone()[0]
+
     # Fetch Post by hash from db
     def get_post_by_hash(self, hash):
         """
@@ -46,13 +467,12 @@ class DB:
 
         self.logger.debug(f"Fetching post with hash {hash}")
 
-        self.c.execute("SELECT * FROM posts WHERE hash=?", (hash,))
-        result = self.c.fetchone()
+        with self._read_conn() as conn:
+            result = conn.execute(f"SELECT {COLUMNS_SQL} FROM posts WHERE hash=?", (hash,)).fetchone()
 
         if result:
-            hash, data = result
             self.logger.debug(f"Found post with hash {hash}")
-            return pickle.loads(data)
+            return row_to_post(result)
         else:
             self.logger.debug(f"Could not find post with hash {hash}")
             return None
@@ -67,8 +487,9 @@ class DB:
 
         self.logger.debug(f"Inserting post with hash {post.hash}")
 
-        self.c.execute("INSERT INTO posts VALUES (?, ?)", (post.hash, pickle.dumps(post)))
-        self.conn.commit()
+        with self.lock:
+            self.c.execute(INSERT_SQL, post_to_row(post))
+            self._commit()
 
         self.logger.debug(f"Successfully inserted post with hash {post.hash}")
 
@@ -82,41 +503,106 @@ class DB:
 
         self.logger.debug(f"Updating post with hash {post.hash}")
 
-        self.c.execute("UPDATE posts SET data=? WHERE hash=?", (pickle.dumps(post), post.hash))
-        self.conn.commit()
+        row = post_to_row(post)
+        with self.lock:
+            self.c.execute(UPDATE_SQL, (*row[1:], row[0]))
+            self._commit()
 
         self.logger.debug(f"Successfully updated post with hash {post.hash}")
 
     # Delete a Post object from DB
     def delete_post(self, post: Post):
         """
-        Delete a Post object from the database.
+        Delete a Post object and its jobs from the database.
 
         :param post: The Post object to delete.
         """
 
         self.logger.debug(f"Deleting post with hash {post.hash}")
 
-        self.c.execute("DELETE FROM posts WHERE hash=?", (post.hash,))
-        self.conn.commit()
+        with self.lock:
+            self.c.execute("DELETE FROM posts WHERE hash=?", (post.hash,))
+            # Its jobs (see src/jobs.py) would keep a re-crawled Post with the same hash from being queued
+            if self.c.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'jobs'").fetchone():
+                self.c.execute("DELETE FROM jobs WHERE post_hash=?", (post.hash,))
+            self._commit()
 
         self.logger.debug(f"Successfully deleted post with hash {post.hash}")
 
-    # Update a Post in DB
-    def update_post(self, post: Post):
+    def set_flags(self, post, **flags):
         """
-        Update a Post object in the database.
+        Set stage flags of a stored Post without rewriting its content.
 
-        :param post: The Post object to update.
-        :param loglevel: The log level for logging messages (default: logging.INFO).
+        Setting a flag also stores the metadata of that stage (see STAGE_COLUMNS) from the Post's attributes.
+
+        :param post: The Post or PostRecord to update. Its attributes are updated as well.
+        :param flags: The flags to set, e.g. audio=True.
         """
+        unknown = set(flags) - set(FLAG_COLUMNS)
+        if unknown:
+            raise ValueError(f"Unknown flags {', '.join(sorted(unknown))}")
 
-        self.logger.debug(f"Updating post with hash {post.hash}")
+        self.logger.debug(f"Setting {', '.join(flags)} of post with hash {post.hash}")
 
-        self.c.execute("UPDATE posts SET data=? WHERE hash=?", (pickle.dumps(post), post.hash))
-        self.conn.commit()
+        values = {flag: int(bool(value)) for flag, value in flags.items()}
+        for flag, value in flags.items():
+            if value:
+                for column in STAGE_COLUMNS.get(flag, ()):
+                    values[column] = getattr(post, column, None)
 
-        self.logger.debug(f"Successfully updated post with hash {post.hash}")
+        with self.lock:
+            self.c.execute(f"UPDATE posts SET {', '.join(f'{column}=?' for column in values)} WHERE hash=?", (*values.values(), post.hash))
+            for flag, value in flags.items():
+                setattr(post, flag, bool(value))
+            self._commit()
+
+    def insert_many(self, posts, ignore_existing=False):
+        """
+        Insert multiple Post objects into the database with a single statement.
+
+        :param posts: An iterable of Post objects to insert.
+        :param ignore_existing: Skip posts whose hash is already stored instead of failing.
+        :return: The number of inserted posts.
+        """
+        rows = [post_to_row(post) for post in posts]
+
+        self.logger.debug(f"Inserting {len(rows)} posts")
+
+        with self.lock:
+            before = self.conn.total_changes
+            self.c.executemany(INSERT_OR_IGNORE_SQL if ignore_existing else INSERT_SQL, rows)
+            inserted = self.conn.total_changes - before
+            self._commit(inserted)
+
+        return inserted
+
+    def update_many(self, posts):
+        """
+        Update multiple Post objects in the database with a single statement.
+
+        :param posts: An iterable of Post objects to update.
+        """
+        rows = [post_to_row(post) for post in posts]
+
+        self.logger.debug(f"Updating {len(rows)} posts")
+
+        with self.lock:
+            self.c.executemany(UPDATE_SQL, [(*row[1:], row[0]) for row in rows])
+            self._commit(len(rows))
+
+    def delete_many(self, posts):
+        """
+        Delete multiple Post objects from the database with a single statement.
+
+        :param posts: An iterable of Post objects to delete.
+        """
+        hashes = [(post.hash,) for post in posts]
+
+        self.logger.debug(f"Deleting {len(hashes)} posts")
+
+        with self.lock:
+            self.c.executemany("DELETE FROM posts WHERE hash=?", hashes)
+            self._commit(len(hashes))
 
     def get_all_posts(self):
         """
@@ -127,14 +613,35 @@ class DB:
 
         self.logger.debug("Fetching all posts")
 
-        self.c.execute("SELECT * FROM posts")
-        result = self.c.fetchall()
+        posts = list(self.iter_posts())
 
-        posts = []
+        self.logger.debug(f"Found {len(posts)} posts")
 
-        for hash, data in result:
-            posts.append(pickle.loads(data))
+        return posts
 
-        self.logger.debug(f"Found {len(posts)} posts")
+    def get_posts_needing_audio(self, limit=None):
+        """
+        Get the Posts which do not have a generated audio yet.
 
-        return posts
\ No newline at end of file
+        :param limit: The maximum number of posts to return, or None for no limit.
+        :return: A list of Post objects.
+        """
+        return list(self.iter_posts(NEEDS_AUDIO, limit=limit))
+
+    def get_posts_needing_subtitles(self, limit=None):
+        """
+        Get the Posts which have an audio but no subtitles yet.
+
+        :param limit: The maximum number of posts to return, or None for no limit.
+        :return: A list of Post objects.
+        """
+        return list(self.iter_posts(NEEDS_SUBTITLES, limit=limit))
+
+    def get_posts_needing_video(self, limit=None):
+        """
+        Get the Posts which have audio and subtitles but no composed video yet.
+
+        :param limit: The maximum number of posts to return, or None for no limit.
+        :return: A list of Post objects.
+        """
+        return list(self.iter_posts(NEEDS_VIDEO, limit=limit))
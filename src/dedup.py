@@ -0,0 +1,241 @@
+import hashlib
+import itertools
+import logging
+import re
+
+from utils.logger import setup_logger
+from utils.text import shorten_hash
+
+FINGERPRINT_BITS = 64
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+class DedupIndex:
+    """
+    An in-memory set of the Post hashes already stored in the DB.
+
+    It is loaded once per crawl, so checking whether a crawled Post is new is a
+    set lookup instead of a DB query. Hashes are kept as raw digest bytes, which
+    takes half the memory of the hex strings.
+    """
+    def __init__(self, hashes=(), loglevel = logging.INFO):
+        self.logger = setup_logger(__name__, loglevel, emoji='🧬')
+        self._digests = set(bytes.fromhex(hash) for hash in hashes)
+
+    @classmethod
+    def from_db(cls, db, loglevel = logging.INFO):
+        """
+        Load the index from the hash column of a DB.
+
+        Args:
+            db (DB): The DB to read the hashes from.
+
+        Returns:
+            DedupIndex: The loaded index.
+        """
+        index = cls(db.iter_hashes(), loglevel=loglevel)
+        index.logger.debug(f"Loaded {len(index)} known hashes")
+        return index
+
+    def __len__(self):
+        return len(self._digests)
+
+    def __contains__(self, hash):
+        return bytes.fromhex(hash) in self._digests
+
+    def add(self, hash):
+        """
+        Mark a hash as seen.
+
+        Args:
+            hash (str): The hex hash of a Post.
+
+        Returns:
+            bool: True if the hash was new, False if it was already seen.
+        """
+        digest = bytes.fromhex(hash)
+        if digest in self._digests:
+            return False
+        self._digests.add(digest)
+        return True
+
+def simhash(text, shingle_size=3):
+    """
+    Compute the 64 bit SimHash fingerprint of a text.
+
+    Texts sharing most of their word shingles get fingerprints differing in
+    only a few bits, no matter how long they are.
+
+    Args:
+        text (str): The text to fingerprint.
+        shingle_size (int): The number of consecutive words per shingle.
+
+    Returns:
+        int: The fingerprint, or None if the text has fewer words than one shingle.
+    """
+    tokens = _TOKEN_PATTERN.findall(text.lower())
+    if len(tokens) < shingle_size:
+        return None
+    shingles = {' '.join(tokens[i:i + shingle_size]) for i in range(len(tokens) - shingle_size + 1)}
+    bits = [format(int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest(), 'big'), '064b') for shingle in shingles]
+
+    # Majority vote per bit position, counted column by column
+    half = len(bits) / 2
+    fingerprint = 0
+    for column in zip(*bits):
+        fingerprint = (fingerprint << 1) | (column.count('1') > half)
+    return fingerprint
+
+# Posts too short to fingerprint get a row without one, so they are not read again
+_TABLE_SQL = """(
+    hash text PRIMARY KEY,
+    fingerprint integer
+)"""
+
+def _create_table(db):
+    # Called while holding db.lock
+    db.c.execute(f"CREATE TABLE IF NOT EXISTS simhashes {_TABLE_SQL}")
+    # Tables created before such rows were stored require a fingerprint
+    if any(name == 'fingerprint' and notnull for _, name, _, notnull, _, _ in db.c.execute("PRAGMA table_info(simhashes)").fetchall()):
+        db.c.execute("ALTER TABLE simhashes RENAME TO simhashes_old")
+        db.c.execute(f"CREATE TABLE simhashes {_TABLE_SQL}")
+        db.c.execute("INSERT INTO simhashes SELECT hash, fingerprint FROM simhashes_old")
+        db.c.execute("DROP TABLE simhashes_old")
+
+def _to_signed(fingerprint):
+    # SQLite integers are signed 64 bit
+    return fingerprint - (1 << FINGERPRINT_BITS) if fingerprint >= 1 << (FINGERPRINT_BITS - 1) else fingerprint
+
+class NearDuplicateIndex:
+    """
+    Finds stored Posts whose title and content are nearly identical to a new one,
+    like reposts with an edited title or from another account.
+
+    Every Post gets a SimHash fingerprint, stored in the simhashes table of the
+    DB. Fingerprints are split into max_distance + 1 bands; two fingerprints
+    within max_distance bits of each other must agree on at least one band,
+    so only Posts sharing a band are compared instead of all of them.
+    """
+    def __init__(self, max_distance=6, loglevel = logging.INFO):
+        """
+        Args:
+            max_distance (int): The number of differing fingerprint bits up to which Posts count as duplicates.
+        """
+        self.logger = setup_logger(__name__, loglevel, emoji='🧬')
+        self.max_distance = max_distance
+        bands = min(max_distance + 1, FINGERPRINT_BITS)
+        width = FINGERPRINT_BITS // bands
+        # (shift, mask) per band; the last band takes the remaining bits
+        self._bands = [(i * width, (1 << (width if i < bands - 1 else FINGERPRINT_BITS - i * width)) - 1) for i in range(bands)]
+        self._buckets = [{} for _ in self._bands]
+        self._size = 0
+        # Fingerprints of checked Posts which save() has not stored yet
+        self._unsaved = {}
+
+    @staticmethod
+    def fingerprint(post):
+        """
+        Returns:
+            int: The SimHash of the title and content of a Post, or None if it is too short.
+        """
+        return simhash(f"{post.title} {post.content}")
+
+    @classmethod
+    def from_db(cls, db, max_distance=6, batch_size=500, loglevel = logging.INFO):
+        """
+        Load the fingerprints of all stored Posts, creating the simhashes table if needed.
+
+        Fingerprints of Posts which were deleted since are dropped, and missing ones are
+        computed and stored batch by batch, reading the Posts lazily.
+
+        Args:
+            db (DB): The DB holding the Posts.
+            batch_size (int): The number of Posts fingerprinted per write.
+
+        Returns:
+            NearDuplicateIndex: The loaded index.
+        """
+        index = cls(max_distance, loglevel=loglevel)
+        with db.lock:
+            _create_table(db)
+            db.c.execute("DELETE FROM simhashes WHERE hash NOT IN (SELECT hash FROM posts)")
+            db.flush()
+            for hash, fingerprint in db.c.execute("SELECT hash, fingerprint FROM simhashes WHERE fingerprint IS NOT NULL"):
+                index.add(hash, fingerprint & ((1 << FINGERPRINT_BITS) - 1))
+        index.logger.debug(f"Loaded {len(index)} fingerprints")
+
+        # Posts stored before fingerprints were kept, or by a run with the check disabled
+        missing = db.iter_posts("hash NOT IN (SELECT hash FROM simhashes)", columns=('hash', 'title', 'content'), page_size=batch_size)
+        count = 0
+        while batch := list(itertools.islice(missing, batch_size)):
+            for post in batch:
+                fingerprint = index.fingerprint(post)
+                if fingerprint is not None:
+                    index.add(post.hash, fingerprint)
+                    index._unsaved[post.hash] = fingerprint
+            index.save(db, batch)
+            count += len(batch)
+        if count:
+            index.logger.info(f"Fingerprinted {count} stored Posts")
+        return index
+
+    def __len__(self):
+        return self._size
+
+    def find(self, fingerprint):
+        """
+        Find a known Post within max_distance bits of a fingerprint.
+
+        Returns:
+            str: The hash of the closest such Post, or None.
+        """
+        best, best_distance = None, self.max_distance + 1
+        for (shift, mask), buckets in zip(self._bands, self._buckets):
+            for hash, candidate in buckets.get((fingerprint >> shift) & mask, ()):
+                distance = bin(fingerprint ^ candidate).count('1')
+                if distance < best_distance:
+                    best, best_distance = hash, distance
+        return best
+
+    def add(self, hash, fingerprint):
+        """
+        Add the fingerprint of a Post to the index.
+        """
+        for (shift, mask), buckets in zip(self._bands, self._buckets):
+            buckets.setdefault((fingerprint >> shift) & mask, []).append((hash, fingerprint))
+        self._size += 1
+
+    def check(self, post):
+        """
+        Look for a near-duplicate of a Post and add it to the index if there is none.
+
+        Returns:
+            str: The hash of the stored Post it duplicates, or None if it is new.
+        """
+        fingerprint = self.fingerprint(post)
+        if fingerprint is None:
+            return None
+        duplicate = self.find(fingerprint)
+        if duplicate is not None:
+            self.logger.debug(f"Post {post.short_hash} is a near-duplicate of {shorten_hash(duplicate)}")
+            return duplicate
+        self.add(post.hash, fingerprint)
+        self._unsaved[post.hash] = fingerprint
+        return None
+
+    def save(self, db, posts):
+        """
+        Store the fingerprints of newly inserted Posts.
+
+        Args:
+            db (DB): The DB the Posts were inserted into.
+            posts (iterable): The Posts.
+        """
+        rows = []
+        for post in posts:
+            fingerprint = self._unsaved.pop(post.hash, None)
+            if fingerprint is None:
+                fingerprint = self.fingerprint(post)
+            rows.append((post.hash, None if fingerprint is None else _to_signed(fingerprint)))
+        with db.lock:
+            db.c.executemany("INSERT OR IGNORE INTO simhashes (hash, fingerprint) VALUES (?, ?)", rows)
+            db.flush()
@@ -0,0 +1,80 @@
+import json
+import logging
+import os
+import threading
+
+from utils.logger import setup_logger
+
+class FeedCache:
+    """
+    Remembers, per feed URL, the HTTP validators and content digest of the last
+    response and the keys of the entries it contained.
+
+    ContentGetter uses it for conditional GETs (If-None-Match / If-Modified-Since),
+    to skip parsing unchanged feeds, and to only build Posts for new entries.
+    Changes are kept in memory until save(), so a caller can drop them if it did
+    not ingest what it crawled.
+    """
+    def __init__(self, path, loglevel = logging.INFO):
+        """
+        Args:
+            path (str): The JSON file to load the cache from and save it to.
+        """
+        self.logger = setup_logger(__name__, loglevel, emoji='🗂️')
+        self.path = path
+        self._lock = threading.Lock()
+        self._feeds = {}
+
+        if os.path.isfile(path):
+            try:
+                with open(path) as file:
+                    self._feeds = json.load(file)
+            except (OSError, ValueError) as e:
+                self.logger.warning(f"Ignoring unreadable feed cache {path}: {e}")
+
+    def get(self, url):
+        """
+        Returns:
+            dict: The cached 'etag', 'last_modified', 'digest' and 'seen' entry keys of a feed (empty if unknown).
+        """
+        with self._lock:
+            return dict(self._feeds.get(url, {}))
+
+    def request_headers(self, url):
+        """
+        Returns:
+            dict: The conditional request headers for a feed.
+        """
+        cached = self.get(url)
+        headers = {}
+        if cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached.get('last_modified'):
+            headers['If-Modified-Since'] = cached['last_modified']
+        return headers
+
+    def update(self, url, etag, last_modified, digest, seen):
+        """
+        Remember the latest response of a feed.
+
+        Args:
+            etag (str): The ETag response header, or None.
+            last_modified (str): The Last-Modified response header, or None.
+            digest (str): A digest of the response body.
+            seen (iterable): The keys of all entries in the response.
+        """
+        with self._lock:
+            self._feeds[url] = {'etag': etag, 'last_modified': last_modified, 'digest': digest, 'seen': sorted(seen)}
+
+    def save(self):
+        """
+        Write the cache to its file.
+        """
+        with self._lock:
+            data = json.dumps(self._feeds)
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as file:
+            file.write(data)
+        os.replace(tmp_path, self.path)
+        self.logger.debug(f"Saved feed cache with {len(self._feeds)} feeds")
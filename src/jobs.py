@@ -0,0 +1,236 @@
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+
+from contextlib import contextmanager
+
+from src.db import DB, NEEDS_AUDIO, NEEDS_SUBTITLES, NEEDS_VIDEO
+from utils.logger import setup_logger
+from utils.text import shorten_hash
+
+# The Posts each stage has jobs for
+STAGE_CONDITIONS = {
+    'audio': NEEDS_AUDIO,
+    'subtitles': NEEDS_SUBTITLES,
+    'video': NEEDS_VIDEO,
+}
+
+# Job states
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+class JobQueue:
+    """
+    A durable queue of per-Post stage jobs, stored in the posts DB.
+
+    Workers claim jobs with a lease. A worker keeps its lease alive with
+    heartbeats while it works; if it crashes, the lease runs out and the job
+    can be claimed again. Claiming is a single UPDATE, so several worker
+    processes never get the same job. Every claim gets a fresh lease token,
+    and heartbeats, completions and failures only apply while the token still
+    holds the lease, so a worker whose lease ran out cannot touch the job once
+    another worker reclaimed it.
+
+    A failure of the stage itself, such as an outage of the TTS endpoints,
+    does not use up an attempt: the job waits retry_delay seconds and is then
+    tried again. Jobs are created again once their Post needs the stage again,
+    and failed jobs are retried after retry_failed_after seconds if their Post
+    was kept.
+
+    The DB runs in WAL mode, which needs shared memory, so all workers have to
+    run on the machine the DB file is on; network filesystems are not supported.
+    """
+    def __init__(self, db: DB, stage, lease_seconds=300, max_attempts=3, retry_delay=60, retry_failed_after=3600, loglevel = logging.INFO):
+        """
+        Args:
+            db (DB): The DB to store the jobs in.
+            stage (str): The stage whose jobs this queue hands out, one of STAGE_CONDITIONS.
+            lease_seconds (float): How long a claimed job stays reserved without a heartbeat.
+            max_attempts (int): How often a job is tried before it is marked as failed.
+            retry_delay (float): Seconds a job waits after a failure of the stage itself.
+            retry_failed_after (float): Seconds after which a failed job whose Post still needs the stage is tried again.
+        """
+        if stage not in STAGE_CONDITIONS:
+            raise ValueError(f"Unknown stage {stage}")
+
+        self.logger = setup_logger(__name__, loglevel, emoji='📋')
+        self.db = db
+        self.stage = stage
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.retry_failed_after = retry_failed_after
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+
+        with db.lock:
+            db.c.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                post_hash text NOT NULL,
+                stage text NOT NULL,
+                state text NOT NULL DEFAULT 'pending',
+                attempts integer NOT NULL DEFAULT 0,
+                lease_owner text,
+                lease_token text,
+                lease_expires real,
+                created real NOT NULL,
+                updated real NOT NULL,
+                last_error text,
+                PRIMARY KEY (post_hash, stage)
+            )""")
+            db.c.execute("CREATE INDEX IF NOT EXISTS jobs_claimable ON jobs (stage, state, lease_expires, created)")
+            db.flush()
+
+    def _write(self, query, params=()):
+        """
+        Run a job table write and commit it right away, so other workers see it.
+
+        :return: The number of changed rows.
+        """
+        with self.db.lock:
+            changed = self.db.c.execute(query, params).rowcount
+            self.db.flush()
+        return changed
+
+    def enqueue_ready(self):
+        """
+        Create jobs for all Posts which still need this stage and have no job yet.
+
+        Posts which need the stage again although their job is done, and Posts kept
+        after their job failed more than retry_failed_after seconds ago, get a fresh job.
+
+        Returns:
+            int: The number of created or reset jobs.
+        """
+        now = time.time()
+        created = self._write(f"""INSERT INTO jobs (post_hash, stage, created, updated)
+            SELECT hash, ?, ?, ? FROM posts WHERE {STAGE_CONDITIONS[self.stage]}
+            ON CONFLICT (post_hash, stage) DO UPDATE
+                SET state = ?, attempts = 0, lease_expires = NULL, last_error = NULL, created = excluded.created, updated = excluded.updated
+                WHERE jobs.state = ? OR (jobs.state = ? AND jobs.updated < ?)""",
+            (self.stage, now, now, PENDING, DONE, FAILED, now - self.retry_failed_after))
+        if created:
+            self.logger.debug(f"Enqueued {created} {self.stage} jobs")
+        return created
+
+    def claim(self):
+        """
+        Atomically claim the next pending job, or a running job whose lease ran out.
+
+        Pending jobs released with a retry delay, see fail(), are skipped until it passed.
+
+        Returns:
+            tuple: The hash of the claimed Post and the lease token to pass to heartbeat(), complete() and fail(),
+                   or None if there is no claimable job.
+        """
+        now = time.time()
+        token = uuid.uuid4().hex
+        owner = f"{self.worker_id}:{threading.current_thread().name}"
+        with self.db.lock:
+            claimed = self.db.c.execute("""UPDATE jobs
+                SET state = ?, attempts = attempts + 1, lease_owner = ?, lease_token = ?, lease_expires = ?, updated = ?
+                WHERE rowid = (
+                    SELECT rowid FROM jobs
+                    WHERE stage = ? AND state IN (?, ?) AND IFNULL(lease_expires, 0) < ?
+                    ORDER BY created LIMIT 1
+                )""", (RUNNING, owner, token, now + self.lease_seconds, now, self.stage, PENDING, RUNNING, now)).rowcount
+            self.db.flush()
+            if not claimed:
+                return None
+            post_hash, attempts = self.db.c.execute("SELECT post_hash, attempts FROM jobs WHERE lease_token = ?", (token,)).fetchone()
+
+        self.logger.debug(f"Claimed {self.stage} job for post {shorten_hash(post_hash)} (attempt {attempts})")
+        return post_hash, token
+
+    def heartbeat(self, post_hash, token):
+        """
+        Extend the lease of a claimed job.
+
+        Returns:
+            bool: False if the lease was lost to another worker.
+        """
+        now = time.time()
+        return bool(self._write("UPDATE jobs SET lease_expires = ?, updated = ? WHERE post_hash = ? AND stage = ? AND state = ? AND lease_token = ?",
+                                (now + self.lease_seconds, now, post_hash, self.stage, RUNNING, token)))
+
+    @contextmanager
+    def keep_alive(self, post_hash, token):
+        """
+        Send heartbeats for a job from a background thread while the block runs.
+        """
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(self.lease_seconds / 3):
+                if not self.heartbeat(post_hash, token):
+                    self.logger.warning(f"Lost lease on {self.stage} job for post {shorten_hash(post_hash)}")
+                    return
+
+        thread = threading.Thread(target=beat, daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def complete(self, post_hash, token):
+        """
+        Mark a claimed job as done.
+
+        Returns:
+            bool: False if the lease was lost to another worker, which then owns the job.
+        """
+        done = bool(self._write("UPDATE jobs SET state = ?, lease_owner = NULL, lease_token = NULL, lease_expires = NULL, updated = ? WHERE post_hash = ? AND stage = ? AND lease_token = ?",
+                                (DONE, time.time(), post_hash, self.stage, token)))
+        if not done:
+            self.logger.warning(f"Lost lease on {self.stage} job for post {shorten_hash(post_hash)} before completing it")
+        return done
+
+    def fail(self, post_hash, token, reason=None, stage_error=False):
+        """
+        Release a claimed job after a failed attempt.
+
+        The job goes back to pending unless it used up its attempts.
+
+        Args:
+            stage_error (bool): The stage failed rather than the Post, e.g. its workers died. The attempt
+                                is not counted, and the job is held back for retry_delay seconds instead.
+
+        Returns:
+            str: The new state of the job, PENDING or FAILED, or None if the lease was lost to another worker.
+        """
+        now = time.time()
+        with self.db.lock:
+            if stage_error:
+                changed = self.db.c.execute("""UPDATE jobs
+                    SET state = ?, attempts = attempts - 1,
+                        lease_owner = NULL, lease_token = NULL, lease_expires = ?, updated = ?, last_error = ?
+                    WHERE post_hash = ? AND stage = ? AND lease_token = ?""",
+                    (PENDING, now + self.retry_delay, now, reason, post_hash, self.stage, token)).rowcount
+            else:
+                changed = self.db.c.execute("""UPDATE jobs
+                    SET state = CASE WHEN attempts >= ? THEN ? ELSE ? END,
+                        lease_owner = NULL, lease_token = NULL, lease_expires = NULL, updated = ?, last_error = ?
+                    WHERE post_hash = ? AND stage = ? AND lease_token = ?""",
+                    (self.max_attempts, FAILED, PENDING, now, reason, post_hash, self.stage, token)).rowcount
+            state = self.db.c.execute("SELECT state FROM jobs WHERE post_hash = ? AND stage = ?", (post_hash, self.stage)).fetchone() if changed else None
+            self.db.flush()
+        if state is None:
+            self.logger.warning(f"Lost lease on {self.stage} job for post {shorten_hash(post_hash)} before releasing it")
+            return None
+        return state[0]
+
+    def counts(self):
+        """
+        Count the jobs of this stage by state.
+
+        Returns:
+            dict: A mapping of state to number of jobs.
+        """
+        with self.db.lock:
+            rows = self.db.c.execute("SELECT state, COUNT(*) FROM jobs WHERE stage = ? GROUP BY state", (self.stage,)).fetchall()
+        return dict(rows)
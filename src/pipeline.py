@@ -0,0 +1,116 @@
+import logging
+import queue
+import threading
+import time
+
+from utils.logger import setup_logger
+from utils.metrics import metrics
+
+# Put into a stage queue to tell one of its workers to stop
+_STOP = object()
+
+class Stage:
+    """
+    One step of a Pipeline, run by its own pool of worker threads.
+    """
+    def __init__(self, name, fn, workers=1, queue_size=None):
+        """
+        Args:
+            name (str): The name of the stage, used for logging.
+            fn (callable): Called with each Post, returns True if the Post may move on to the next stage.
+            workers (int): The number of worker threads of this stage.
+            queue_size (int, optional): The capacity of the input queue. Defaults to twice the worker count.
+        """
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, workers)
+        self.queue = queue.Queue(maxsize=queue_size or self.workers * 2)
+
+        self.successes = 0
+        self.failures = 0
+        self.busy_time = 0.0
+        self._lock = threading.Lock()
+
+    def _record(self, success, duration):
+        with self._lock:
+            if success:
+                self.successes += 1
+            else:
+                self.failures += 1
+            self.busy_time += duration
+
+class Pipeline:
+    """
+    Streams Posts through a chain of Stages connected by bounded queues.
+
+    A Post moves on to the next stage as soon as the previous one finishes it,
+    so e.g. transcription runs while other Posts are still waiting for TTS.
+    The bounded queues keep memory flat and make a slow stage hold back the
+    ones before it instead of letting work pile up.
+    """
+    def __init__(self, stages, loglevel = logging.INFO):
+        self.logger = setup_logger(__name__, loglevel, emoji='🚰')
+        self.stages = stages
+
+    def _worker(self, index):
+        stage = self.stages[index]
+        next_stage = self.stages[index + 1] if index + 1 < len(self.stages) else None
+
+        while True:
+            post = stage.queue.get()
+            if post is _STOP:
+                return
+            metrics.set_gauge('queue_depth', stage.queue.qsize(), stage=stage.name)
+
+            start = time.time()
+            try:
+                success = stage.fn(post)
+            except Exception as exc:
+                self.logger.error(f"{stage.name}: Error processing post {post.short_hash}: {exc}")
+                success = False
+            stage._record(success, time.time() - start)
+
+            if success and next_stage:
+                next_stage.queue.put(post)
+                metrics.set_gauge('queue_depth', next_stage.queue.qsize(), stage=next_stage.name)
+            elif not success:
+                self.logger.debug(f"{stage.name}: Failed on post {post.short_hash}, dropping it from the pipeline")
+
+    def run(self, posts):
+        """
+        Feed Posts through all stages and wait until every one of them has finished.
+
+        Args:
+            posts (iterable): The Posts to process. Consumed lazily as the first stage frees up.
+
+        Returns:
+            list: The stages, holding their success and failure counts.
+        """
+        start = time.time()
+
+        threads = []
+        for index, stage in enumerate(self.stages):
+            stage_threads = [threading.Thread(target=self._worker, args=(index,), name=f"{stage.name}-{n}", daemon=True) for n in range(stage.workers)]
+            for thread in stage_threads:
+                thread.start()
+            threads.append(stage_threads)
+
+        fed = 0
+        for post in posts:
+            self.stages[0].queue.put(post)
+            metrics.set_gauge('queue_depth', self.stages[0].queue.qsize(), stage=self.stages[0].name)
+            fed += 1
+
+        # Stop the stages in order; a stage's output is complete once all its workers are done
+        for stage, stage_threads in zip(self.stages, threads):
+            for _ in stage_threads:
+                stage.queue.put(_STOP)
+            for thread in stage_threads:
+                thread.join()
+
+        end = time.time()
+        self.logger.info(f"Pipeline processed {fed} Posts in {end - start} seconds")
+        for stage in self.stages:
+            self.logger.info(f"{stage.name}: {stage.successes} succeeded, {stage.failures} failed, {stage.busy_time / stage.workers:.1f} busy seconds per worker")
+
+        return self.stages
@@ -1,15 +1,40 @@
-import whisper
 import logging
+import os
 
+from src.asr import get_backend
+from src.transcriber import TranscriptionError
 from utils.logger import setup_logger
+from utils.metrics import metrics
 from config.structure import AUDIO_DIR, SUBTITLE_DIR
 from utils.text import shorten_hash
+from utils import pcm, subtitles
+
+# How Subtitler produces subtitles
+MODES = ('aligned', 'whisper')
 
 class Subtitler:
-    def __init__(self, loglevel = logging.INFO):
+    def __init__(self, loglevel = logging.INFO, model = None, mode = 'aligned', max_chars = 42):
+        """
+        Args:
+            model (optional): An ASR backend, see src/asr.py, or any object with a whisper-compatible transcribe() method.
+                Defaults to openai-whisper's 'small.en' model, loaded when it is first needed.
+            mode (str): 'aligned' lays out the known text of the audio stage's chunks over their durations
+                and only transcribes audio without timings; 'whisper' always transcribes.
+            max_chars (int): The maximum length of an aligned subtitle cue.
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown subtitle mode {mode}, choose from {', '.join(MODES)}")
         self.logger = setup_logger(__name__, loglevel, emoji='📝')
-        self.model = whisper.load_model('small.en')
-        self.writer = whisper.utils.WriteSRT(SUBTITLE_DIR)
+        self.mode = mode
+        self.max_chars = max_chars
+        # Backends load their model on the first transcription, which aligned runs mostly do without
+        self.model = model if model is not None else get_backend('whisper', loglevel=loglevel)
+
+    def close(self):
+        """Stop the model's worker processes, if it has any."""
+        close = getattr(self.model, 'close', None)
+        if close:
+            close()
 
     def from_post(self, post):
         if post.audio and not post.subtitles:
@@ -21,21 +46,60 @@ class Subtitler:
             self.logger.debug(f"Skipping subtitle generation for post {shorten_hash(post.hash)} because it already has subtitles")
             return True
         
+    def _from_timings(self, hash, timings):
+        """
+        Write subtitles from the chunk texts and durations recorded by the audio stage.
+        """
+        with metrics.timer('align_seconds'):
+            cues = subtitles.align(subtitles.load_timings(timings), max_chars=self.max_chars)
+            subtitles.write_srt(f'{SUBTITLE_DIR}/{hash}.srt', cues)
+
+        # Only needed for transcription
+        sidecar = pcm.sidecar_path(hash)
+        if os.path.isfile(sidecar):
+            os.remove(sidecar)
+
+        metrics.add_file_bytes(f'{SUBTITLE_DIR}/{hash}.srt', stage='subtitles')
+        metrics.inc('subtitles_total', method='aligned')
+        self.logger.debug(f"Generated aligned subtitles for post {shorten_hash(hash)}")
+        return True
+
     def from_hash(self, hash):
         """
-        Generate subtitles from a post hash.
+        Generate subtitles from a post hash, aligned to the known text if possible.
 
         Args:
             hash (str): The hash of the post to generate subtitles from.
         
         Returns:
             bool: True if subtitle generation is successful, False otherwise.
+
+        Raises:
+            TranscriptionError: If the transcription workers failed, which says nothing about the post.
         """
         try:
-            result = self.model.transcribe(f'{AUDIO_DIR}/{hash}.mp3')
-            self.writer(result, f'{SUBTITLE_DIR}/{hash}.srt')
+            timings = subtitles.timings_path(hash)
+            if self.mode == 'aligned' and os.path.isfile(timings):
+                return self._from_timings(hash, timings)
+
+            # Transcribe the PCM sidecar of the audio stage if there is one, which saves decoding the MP3 again
+            sidecar = pcm.sidecar_path(hash)
+            audio = sidecar if os.path.isfile(sidecar) else f'{AUDIO_DIR}/{hash}.mp3'
+            with metrics.timer('transcribe_seconds'):
+                result = self.model.transcribe(audio)
+            subtitles.write_srt(f'{SUBTITLE_DIR}/{hash}.srt', [(segment['start'], segment['end'], segment['text'].strip()) for segment in result['segments']])
+            if audio == sidecar:
+                # Nothing else reads the sidecar
+                os.remove(sidecar)
+            metrics.add_file_bytes(f'{SUBTITLE_DIR}/{hash}.srt', stage='subtitles')
+            metrics.inc('subtitles_total', method='whisper')
             self.logger.debug(f"Generated subtitles for post {shorten_hash(hash)}")
             return True
+        except TranscriptionError as e:
+            metrics.inc('failures_total', stage='subtitles', reason=type(e).__name__)
+            self.logger.error(f"Failed to transcribe post {shorten_hash(hash)}: {e}")
+            raise
         except Exception as e:
+            metrics.inc('failures_total', stage='subtitles', reason=type(e).__name__)
             self.logger.error(f"Failed to generate subtitles for post {shorten_hash(hash)}: {e}")
             return False
@@ -0,0 +1,125 @@
+import concurrent.futures
+import concurrent.futures.process
+import logging
+import multiprocessing
+import os
+import threading
+
+from src.asr import get_backend
+from utils.logger import setup_logger
+
+# State of a worker process, set up once by _init_worker()
+_model = None
+
+def _init_worker(backend, options, threads, counter, pin):
+    """
+    Limit the threads of a worker process and load its model.
+    """
+    global _model
+
+    # Before torch or CTranslate2 are imported, so their OpenMP/MKL pools are created at this size
+    for variable in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'):
+        os.environ[variable] = str(threads)
+
+    if pin and hasattr(os, 'sched_setaffinity'):
+        # Give every worker its own block of cores
+        with counter.get_lock():
+            index = counter.value
+            counter.value += 1
+        cores = sorted(os.sched_getaffinity(0))
+        block = cores[index * threads % len(cores):][:threads]
+        if block:
+            os.sched_setaffinity(0, block)
+
+    _model = get_backend(backend, threads=threads, **options)
+    _model.load()
+
+class TranscriptionError(Exception):
+    """
+    Raised when the worker processes, rather than the audio, failed a transcription.
+    """
+
+def _transcribe(audio, kwargs):
+    return _model.transcribe(audio, **kwargs)
+
+class TranscriptionPool:
+    """
+    A pool of worker processes which each hold one speech recognition model, see src/asr.py.
+
+    Whisper inference only scales to a few cores in one process, so this runs
+    several processes side by side, each with its own slice of the cores. It
+    has the same transcribe() method as the backends, so it can be passed
+    to Subtitler and called from as many threads as there are workers.
+
+    The workers are started, and their models loaded, on the first transcription.
+    If a worker dies, e.g. killed for running out of memory, the pool is
+    restarted and the transcription retried once.
+    """
+    def __init__(self, workers, threads=None, backend='whisper', options=None, pin=True, loglevel = logging.INFO):
+        """
+        Args:
+            workers (int): The number of worker processes.
+            threads (int, optional): The number of inference threads per worker. Defaults to an equal share of the CPUs.
+            backend (str): The ASR backend every worker loads, one of asr.BACKENDS.
+            options (dict, optional): Options of the backend, such as model_name.
+            pin (bool): Pin every worker to its own block of cores, where the OS supports it.
+        """
+        self.logger = setup_logger(__name__, loglevel, emoji='🎙️')
+        self.workers = max(1, workers)
+        self.threads = threads or max(1, (os.cpu_count() or 1) // self.workers)
+        self.backend = backend
+        self.options = options or {}
+        self.pin = pin
+
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self.logger.info(f"Starting {self.workers} {self.backend} workers with {self.threads} threads each")
+                # spawn rather than fork, since a forked inference thread pool can deadlock
+                context = multiprocessing.get_context('spawn')
+                self._executor = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=context, initializer=_init_worker,
+                    initargs=(self.backend, self.options, self.threads, context.Value('i', 0), self.pin))
+            return self._executor
+
+    def _restart(self, executor):
+        with self._lock:
+            # Other threads may have seen the same broken executor and restarted it already
+            if self._executor is executor:
+                self.logger.warning(f"A {self.backend} worker died, restarting the workers")
+                executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def transcribe(self, audio, **kwargs):
+        """
+        Transcribe audio in one of the workers.
+
+        Args:
+            audio (str or numpy.ndarray): An audio file or PCM sidecar path, or 16 kHz mono float32 samples.
+                Pass sidecars by path, so the worker maps them instead of receiving the samples pickled.
+            kwargs: Passed on to the backend's transcribe().
+
+        Returns:
+            dict: The transcription, in whisper's format.
+
+        Raises:
+            TranscriptionError: If the workers died again after a restart.
+        """
+        for attempt in range(2):
+            executor = self._get_executor()
+            try:
+                return executor.submit(_transcribe, audio, kwargs).result()
+            except concurrent.futures.process.BrokenProcessPool as e:
+                self._restart(executor)
+                error = e
+        raise TranscriptionError(f"{self.backend} workers died: {error}")
+
+    def close(self):
+        """Stop the workers."""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
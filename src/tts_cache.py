@@ -0,0 +1,142 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+
+from utils.logger import setup_logger
+from utils.metrics import metrics
+from utils.text import collapse_whitespace
+from utils.tiktok_tts import PROTOCOL_VERSION
+
+class TTSCache:
+    """
+    A content-addressed on-disk cache of synthesized TTS chunks.
+
+    Entries are keyed by voice, whitespace-normalized chunk text and the TTS
+    protocol version, and hold the MP3 bytes as returned by the endpoint, so
+    retries, re-runs and repeated texts skip the network. When the cache grows
+    beyond its size budget, the least recently used entries are evicted; an
+    entry's modification time records its last use, so the order survives restarts.
+    """
+    def __init__(self, directory, max_bytes, version=PROTOCOL_VERSION, loglevel = logging.INFO):
+        """
+        Args:
+            directory (str): The directory to store the entries in.
+            max_bytes (int): The size budget of all entries together.
+            version (int): The TTS protocol version; entries of other versions are never returned.
+        """
+        self.logger = setup_logger(__name__, loglevel, emoji='💾')
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.version = version
+
+        self._lock = threading.Lock()
+        # key -> (size, last use); insertion order is not relied upon
+        self._entries = {}
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(directory, exist_ok=True)
+        for entry in os.scandir(directory):
+            if entry.is_file() and entry.name.endswith('.mp3'):
+                stat = entry.stat()
+                self._entries[entry.name[:-4]] = (stat.st_size, stat.st_mtime)
+                self._size += stat.st_size
+        self.logger.debug(f"Loaded {len(self._entries)} cached chunks ({self._size / 1e6:.1f} MB)")
+
+    def key(self, voice, text):
+        """
+        Returns:
+            str: The content address of a chunk.
+        """
+        return hashlib.sha256(f"{self.version}\0{voice}\0{collapse_whitespace(text)}".encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f'{key}.mp3')
+
+    def get(self, voice, text):
+        """
+        Returns:
+            bytes: The cached MP3 of a chunk, or None on a miss.
+        """
+        key = self.key(voice, text)
+        try:
+            with open(self._path(key), 'rb') as file:
+                audio = file.read()
+        except OSError:
+            # Also covers entries evicted by another process sharing the directory
+            with self._lock:
+                self.misses += 1
+                entry = self._entries.pop(key, None)
+                if entry:
+                    self._size -= entry[0]
+            metrics.inc('tts_cache_requests_total', result='miss')
+            return None
+
+        now = time.time()
+        try:
+            os.utime(self._path(key), (now, now))
+        except OSError:
+            pass
+        with self._lock:
+            self.hits += 1
+            if key not in self._entries:
+                self._size += len(audio)
+            self._entries[key] = (len(audio), now)
+        metrics.inc('tts_cache_requests_total', result='hit')
+        return audio
+
+    def put(self, voice, text, audio):
+        """
+        Store the MP3 of a chunk, evicting the least recently used entries if over budget.
+        """
+        key = self.key(voice, text)
+        path = self._path(key)
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as file:
+            file.write(audio)
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            previous = self._entries.get(key)
+            if previous:
+                self._size -= previous[0]
+            self._entries[key] = (len(audio), time.time())
+            self._size += len(audio)
+            if self._size > self.max_bytes:
+                self._evict()
+        metrics.set_gauge('tts_cache_bytes', self._size)
+
+    def _evict(self):
+        # Called while holding self._lock; evicts down to 90% of the budget so this does not run on every put
+        target = self.max_bytes * 0.9
+        for key, (size, _) in sorted(self._entries.items(), key=lambda item: item[1][1]):
+            if self._size <= target:
+                break
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+            del self._entries[key]
+            self._size -= size
+            self.evictions += 1
+            metrics.inc('tts_cache_evictions_total')
+
+    def stats(self):
+        """
+        Returns:
+            dict: The hits, misses, hit rate, evictions, entries and bytes of the cache.
+        """
+        with self._lock:
+            requests = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / requests if requests else 0.0,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._size,
+            }
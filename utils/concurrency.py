@@ -0,0 +1,143 @@
+import logging
+import os
+import threading
+import time
+
+from collections import deque
+
+from utils.logger import setup_logger
+from utils.metrics import metrics
+
+class ConcurrencyController:
+    """
+    Limits how many tasks of a stage run at once, and adapts that limit at runtime.
+
+    The thread pool of a stage is sized for max_workers and every task runs
+    through the controller, which only lets `limit` of them run concurrently.
+    After each window of finished tasks, the limit is adjusted AIMD-style:
+    halved on errors or rate limiting, decreased when latency inflates well
+    beyond the best observed latency (or, for CPU-bound stages, when the
+    machine is saturated), and increased by one otherwise.
+    """
+    def __init__(self, name, min_workers, max_workers, initial=None, cpu_bound=False, error_threshold=0.2, min_reference_samples=32, loglevel = logging.INFO):
+        """
+        Args:
+            name (str): The name of the stage, used for logging and metrics.
+            min_workers (int): The lowest allowed limit.
+            max_workers (int): The highest allowed limit, which is also the thread pool size.
+            initial (int, optional): The starting limit. Defaults to min_workers.
+            cpu_bound (bool): Whether to hold back when the CPU load per core reaches 1.
+            error_threshold (float): The share of failed tasks in a window which halves the limit.
+            min_reference_samples (int): The number of tasks to finish before latency is compared
+                                         against the best observed one, so a few untypical windows
+                                         cannot set the reference on their own.
+        """
+        self.logger = setup_logger(__name__, loglevel, emoji='🎚️')
+        self.name = name
+        self.min_workers = max(1, min_workers)
+        self.max_workers = max(self.min_workers, max_workers)
+        self.limit = min(max(initial or self.min_workers, self.min_workers), self.max_workers)
+        self.cpu_bound = cpu_bound
+        self.error_threshold = error_threshold
+        self.min_reference_samples = min_reference_samples
+
+        self._cond = threading.Condition()
+        self._active = 0
+        self._latencies = []
+        self._errors = 0
+        self._rate_limited = 0
+        self._window_medians = deque(maxlen=20)
+        self._reference_samples = 0
+
+        metrics.set_gauge('concurrency_limit', self.limit, stage=self.name)
+
+    def run(self, fn, *args, **kwargs):
+        """
+        Run fn once a slot is free and record its latency and outcome.
+
+        A falsy return value or an exception counts as an error; exceptions are re-raised.
+        """
+        with self._cond:
+            while self._active >= self.limit:
+                self._cond.wait()
+            self._active += 1
+
+        start = time.perf_counter()
+        success = False
+        try:
+            result = fn(*args, **kwargs)
+            success = bool(result)
+            return result
+        finally:
+            with self._cond:
+                self._active -= 1
+                self._record(time.perf_counter() - start, success)
+                self._cond.notify_all()
+
+    def wrap(self, fn):
+        """
+        Returns:
+            callable: fn, run through this controller.
+        """
+        return lambda *args, **kwargs: self.run(fn, *args, **kwargs)
+
+    def report_rate_limit(self):
+        """
+        Count a rate limit response seen by a task, halving the limit at the end of the window.
+
+        Tasks usually handle errors themselves, so the clients they use report rate limiting
+        through this, e.g. as TTSClient's on_rate_limit callback.
+        """
+        with self._cond:
+            self._rate_limited += 1
+
+    def _cpu_load(self):
+        try:
+            return os.getloadavg()[0] / (os.cpu_count() or 1)
+        except (AttributeError, OSError):
+            return None
+
+    def _record(self, latency, success):
+        # Called while holding self._cond
+        self._latencies.append(latency)
+        if not success:
+            self._errors += 1
+
+        if len(self._latencies) >= max(8, self.limit):
+            self._adjust()
+
+    def _adjust(self):
+        # Called while holding self._cond
+        samples = sorted(self._latencies)
+        median = samples[len(samples) // 2]
+        error_rate = self._errors / len(samples)
+
+        # Compare against the best of the recent windows, so the reference can follow
+        # lasting changes of the service latency
+        self._window_medians.append(median)
+        best_latency = min(self._window_medians)
+        self._reference_samples += len(samples)
+        latency_known = self._reference_samples >= self.min_reference_samples
+
+        load = self._cpu_load() if self.cpu_bound else None
+
+        if self._rate_limited or error_rate > self.error_threshold:
+            new_limit, reason = self.limit // 2, f"{self._rate_limited} rate limited, {error_rate:.0%} errors"
+        elif latency_known and median > best_latency * 2:
+            new_limit, reason = self.limit - 1, f"latency {median:.2f}s vs best {best_latency:.2f}s"
+        elif load is not None and load >= 1.0:
+            new_limit, reason = self.limit - 1, f"CPU load {load:.2f} per core"
+        elif load is not None and load >= 0.85:
+            new_limit, reason = self.limit, f"CPU load {load:.2f} per core"
+        else:
+            new_limit, reason = self.limit + 1, "healthy"
+
+        new_limit = min(max(new_limit, self.min_workers), self.max_workers)
+        if new_limit != self.limit:
+            self.logger.debug(f"{self.name}: concurrency {self.limit} -> {new_limit} ({reason})")
+            self.limit = new_limit
+            metrics.set_gauge('concurrency_limit', self.limit, stage=self.name)
+
+        self._latencies = []
+        self._errors = 0
+        self._rate_limited = 0
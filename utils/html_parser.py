@@ -0,0 +1,147 @@
+"""
+Backends for the HTML extraction done by ContentGetter.
+
+Every backend pulls the same fields out of a page, so they can be swapped for
+speed: selectolax and lxml parse in C and only walk the elements we select,
+while the BeautifulSoup backend is the pure Python reference every other
+backend must match (see bench/parsers.py).
+"""
+from bs4 import BeautifulSoup
+
+TITLE_SELECTOR = 'a[id*="post-title"]'
+AUTHOR_SELECTOR = 'span[slot="authorName"]'
+CONTENT_SELECTOR = 'div[id*="post-rtjson-content"]'
+
+# The same selectors for lxml, which needs the extra cssselect package for CSS
+XPATHS = {
+    'title': './/a[contains(@id, "post-title")]',
+    'author': './/span[@slot="authorName"]',
+    'content': './/div[contains(@id, "post-rtjson-content")]',
+}
+
+class SoupParser:
+    """Extraction with BeautifulSoup and the built-in html.parser."""
+    name = 'bs4'
+
+    def paragraph_text(self, html):
+        """
+        Returns:
+            str: The concatenated text of all <p> elements.
+        """
+        return ''.join(p.get_text() for p in BeautifulSoup(html, 'html.parser').find_all('p'))
+
+    def web_posts(self, html):
+        """
+        Extract the posts of a Reddit /top page.
+
+        Returns:
+            list: One dict per shreddit-post with its 'id', 'title', 'author' and 'content',
+                  each None if the element is missing.
+        """
+        soup = BeautifulSoup(html, 'html.parser')
+        posts = []
+        for post in soup.find_all('shreddit-post'):
+            fields = {'id': post.get('id')}
+            for field, selector in (('title', TITLE_SELECTOR), ('author', AUTHOR_SELECTOR), ('content', CONTENT_SELECTOR)):
+                element = post.select_one(selector)
+                fields[field] = element.get_text() if element is not None else None
+            posts.append(fields)
+        return posts
+
+class LxmlParser:
+    """Extraction with lxml.html."""
+    name = 'lxml'
+
+    def __init__(self):
+        import lxml.html
+        from lxml import etree
+        # Reddit serves UTF-8; without this lxml would guess latin-1 for pages lacking a charset declaration
+        self._html_parser = lxml.html.HTMLParser(encoding='utf-8')
+        self._fromstring = lxml.html.fromstring
+        self._xpaths = {field: etree.XPath(xpath) for field, xpath in XPATHS.items()}
+
+    def _parse(self, html):
+        # lxml refuses str input with an encoding declaration, and fails on empty documents
+        if isinstance(html, str):
+            html = html.encode('utf-8')
+        return self._fromstring(html, parser=self._html_parser) if html.strip() else None
+
+    def paragraph_text(self, html):
+        root = self._parse(html)
+        if root is None:
+            return ''
+        return ''.join(str(p.text_content()) for p in root.iter('p'))
+
+    def web_posts(self, html):
+        root = self._parse(html)
+        if root is None:
+            return []
+        posts = []
+        for post in root.iter('shreddit-post'):
+            fields = {'id': post.get('id')}
+            for field, xpath in self._xpaths.items():
+                elements = xpath(post)
+                fields[field] = str(elements[0].text_content()) if elements else None
+            posts.append(fields)
+        return posts
+
+class SelectolaxParser:
+    """Extraction with selectolax and the lexbor engine."""
+    name = 'selectolax'
+
+    def __init__(self):
+        from selectolax.lexbor import LexborHTMLParser
+        self._parser = LexborHTMLParser
+
+    def paragraph_text(self, html):
+        return ''.join(p.text(deep=True) for p in self._parser(html).css('p'))
+
+    def web_posts(self, html):
+        posts = []
+        for post in self._parser(html).css('shreddit-post'):
+            fields = {'id': post.attributes.get('id')}
+            for field, selector in (('title', TITLE_SELECTOR), ('author', AUTHOR_SELECTOR), ('content', CONTENT_SELECTOR)):
+                element = post.css_first(selector)
+                fields[field] = element.text(deep=True) if element is not None else None
+            posts.append(fields)
+        return posts
+
+# In order of preference
+PARSERS = {parser.name: parser for parser in (SelectolaxParser, LxmlParser, SoupParser)}
+
+def available_parsers():
+    """
+    Returns:
+        list: The names of all backends whose dependencies are installed, fastest first.
+    """
+    names = []
+    for name, parser in PARSERS.items():
+        try:
+            parser()
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+def get_parser(name=None):
+    """
+    Args:
+        name (str, optional): The backend to use. Defaults to the fastest installed one.
+
+    Returns:
+        The parser instance.
+
+    Raises:
+        ValueError: If the backend is unknown.
+        ImportError: If the requested backend is not installed.
+    """
+    if name is not None:
+        if name not in PARSERS:
+            raise ValueError(f"Unknown HTML parser {name}, choose one of {', '.join(PARSERS)}")
+        return PARSERS[name]()
+    for parser in PARSERS.values():
+        try:
+            return parser()
+        except ImportError:
+            continue
+    return SoupParser()
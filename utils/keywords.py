@@ -0,0 +1,81 @@
+from collections import deque
+
+class KeywordMatcher:
+    """
+    Finds any of a set of keywords in a text in a single pass (Aho-Corasick).
+
+    The time per text is linear in its length, no matter how many keywords
+    there are, unlike running one search or regex alternative per keyword.
+    Matching is case-insensitive.
+    """
+    def __init__(self, keywords, word_start=True):
+        """
+        Args:
+            keywords (iterable): The keywords to look for.
+            word_start (bool): Only match keywords at the start of a word, so 'kill' matches
+                               'killed' but not 'skill'.
+        """
+        self.word_start = word_start
+        # One dict of transitions per state; state 0 is the root
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [None]
+        # The nearest state along the failure links which ends a keyword
+        self._next_output = [0]
+
+        for keyword in keywords:
+            keyword = keyword.lower()
+            if not keyword:
+                continue
+            state = 0
+            for char in keyword:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(None)
+                    self._next_output.append(0)
+                state = next_state
+            self._output[state] = keyword
+
+        # Breadth-first, so the failure link of every shorter prefix is known first
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                fail = self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._next_output[next_state] = fail if self._output[fail] is not None else self._next_output[fail]
+
+    def __bool__(self):
+        return len(self._goto) > 1
+
+    def find(self, text):
+        """
+        Find the first keyword in a text.
+
+        Returns:
+            str: The (lowercase) keyword found, or None.
+        """
+        goto, fail, output, next_output = self._goto, self._fail, self._output, self._next_output
+        text = text.lower()
+        state = 0
+        for i, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+
+            # Check every keyword ending here, longest first
+            match = state if output[state] is not None else next_output[state]
+            while match:
+                keyword = output[match]
+                start = i - len(keyword) + 1
+                if not self.word_start or start == 0 or not text[start - 1].isalnum():
+                    return keyword
+                match = next_output[match]
+        return None
@@ -0,0 +1,186 @@
+import json
+import os
+import threading
+import time
+
+from contextlib import contextmanager
+
+# Upper bounds (in seconds) of the latency histogram buckets
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+class Histogram:
+    """
+    A cumulative histogram with fixed bucket bounds, as used by Prometheus.
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """
+        Estimate a quantile as the upper bound of the bucket containing it.
+
+        Args:
+            q (float): The quantile, between 0 and 1.
+
+        Returns:
+            float: The estimate, or the largest observed value if it is beyond the last bucket.
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        for bound, count in zip(self.buckets, self.counts):
+            if count >= rank:
+                return bound
+        return self.max
+
+class Metrics:
+    """
+    A thread-safe registry of counters, gauges and latency histograms.
+
+    Every metric is identified by a name and optional labels, e.g.
+    metrics.inc('stage_items_total', stage='audio', result='success').
+    """
+    def __init__(self, prefix='vidgen'):
+        self.prefix = prefix
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+
+    def inc(self, name, value=1, **labels):
+        """Increase a counter."""
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        """Set a gauge to its current value."""
+        key = self._key(name, labels)
+        with self._lock:
+            self._gauges[key] = value
+
+    def observe(self, name, value, **labels):
+        """Record a value, usually a duration in seconds, in a histogram."""
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """Record the duration of the block in a histogram."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def add_file_bytes(self, path, **labels):
+        """Count the size of a written file towards bytes_written_total, if it exists."""
+        try:
+            self.inc('bytes_written_total', os.path.getsize(path), **labels)
+        except OSError:
+            pass
+
+    def report(self):
+        """
+        Build a machine-readable summary of all metrics.
+
+        Returns:
+            dict: The report, ready to be serialized as JSON.
+        """
+        with self._lock:
+            return {
+                'started': self.started,
+                'duration_seconds': time.time() - self.started,
+                'counters': [{'name': name, 'labels': dict(labels), 'value': value} for (name, labels), value in sorted(self._counters.items())],
+                'gauges': [{'name': name, 'labels': dict(labels), 'value': value} for (name, labels), value in sorted(self._gauges.items())],
+                'histograms': [{
+                    'name': name,
+                    'labels': dict(labels),
+                    'count': h.count,
+                    'sum': h.sum,
+                    'mean': h.sum / h.count if h.count else 0.0,
+                    'p50': h.quantile(0.5),
+                    'p90': h.quantile(0.9),
+                    'p99': h.quantile(0.99),
+                    'max': h.max,
+                    'buckets': dict(zip((str(b) for b in h.buckets), h.counts)),
+                } for (name, labels), h in sorted(self._histograms.items())],
+            }
+
+    def prometheus(self):
+        """
+        Render all metrics in the Prometheus text exposition format.
+
+        Returns:
+            str: The rendered metrics.
+        """
+        def fmt(labels, extra=()):
+            pairs = [*labels, *extra]
+            if not pairs:
+                return ''
+            escaped = (f'{k}="{_escape_label(v)}"' for k, v in pairs)
+            return '{' + ','.join(escaped) + '}'
+
+        lines = []
+        typed = set()
+        with self._lock:
+            for kind, items in (('counter', self._counters), ('gauge', self._gauges)):
+                for (name, labels), value in sorted(items.items()):
+                    metric = f'{self.prefix}_{name}'
+                    if metric not in typed:
+                        lines.append(f'# TYPE {metric} {kind}')
+                        typed.add(metric)
+                    lines.append(f'{metric}{fmt(labels)} {value}')
+            for (name, labels), h in sorted(self._histograms.items()):
+                metric = f'{self.prefix}_{name}'
+                if metric not in typed:
+                    lines.append(f'# TYPE {metric} histogram')
+                    typed.add(metric)
+                for bound, count in zip(h.buckets, h.counts):
+                    lines.append(f'{metric}_bucket{fmt(labels, [("le", bound)])} {count}')
+                lines.append(f'{metric}_bucket{fmt(labels, [("le", "+Inf")])} {h.count}')
+                lines.append(f'{metric}_sum{fmt(labels)} {h.sum}')
+                lines.append(f'{metric}_count{fmt(labels)} {h.count}')
+        return '\n'.join(lines) + '\n'
+
+    def write_json(self, path):
+        """Write the JSON run report to a file."""
+        _write_atomic(path, json.dumps(self.report(), indent=2))
+
+    def write_prometheus(self, path):
+        """Write the metrics to a Prometheus textfile collector file."""
+        _write_atomic(path, self.prometheus())
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _write_atomic(path, text):
+    # Write next to the target and rename, so collectors never read a half-written file
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as file:
+        file.write(text)
+    os.replace(tmp_path, path)
+
+# The registry shared by the whole process
+metrics = Metrics()
@@ -0,0 +1,139 @@
+"""
+Just enough of the MP3 (MPEG audio layer III) format to join TTS chunks
+without decoding and re-encoding them: a layer III stream is a plain sequence
+of self-contained frames, so streams with the same sample rate and channel
+count can be concatenated frame by frame.
+"""
+
+# Indexed by the 2 version bits of a frame header
+MPEG1, MPEG2, MPEG25 = 3, 2, 0
+
+BITRATES = {
+    MPEG1: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    MPEG2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+BITRATES[MPEG25] = BITRATES[MPEG2]
+
+SAMPLE_RATES = {
+    MPEG1: (44100, 48000, 32000),
+    MPEG2: (22050, 24000, 16000),
+    MPEG25: (11025, 12000, 8000),
+}
+
+MONO = 3
+
+def _id3_size(data, pos):
+    # An ID3v2 tag: 'ID3', version, flags and a 28 bit syncsafe size, plus an optional footer
+    if data[pos:pos + 3] != b'ID3' or len(data) < pos + 10:
+        return 0
+    size = (data[pos + 6] << 21) | (data[pos + 7] << 14) | (data[pos + 8] << 7) | data[pos + 9]
+    return 10 + size + (10 if data[pos + 5] & 0x10 else 0)
+
+def parse_header(data, pos):
+    """
+    Parse the layer III frame header at a position.
+
+    Returns:
+        tuple: The MPEG version, sample rate, channel count, samples per frame and frame length in bytes,
+               or None if there is no valid header.
+    """
+    if len(data) < pos + 4 or data[pos] != 0xFF or data[pos + 1] & 0xE0 != 0xE0:
+        return None
+    version = (data[pos + 1] >> 3) & 3
+    layer = (data[pos + 1] >> 1) & 3
+    bitrate_index = data[pos + 2] >> 4
+    rate_index = (data[pos + 2] >> 2) & 3
+    # Layer III only; free-format bitrates have no computable frame length
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+
+    sample_rate = SAMPLE_RATES[version][rate_index]
+    bitrate = BITRATES[version][bitrate_index] * 1000
+    padding = (data[pos + 2] >> 1) & 1
+    channels = 1 if data[pos + 3] >> 6 == MONO else 2
+    samples = 1152 if version == MPEG1 else 576
+    length = samples // 8 * bitrate // sample_rate + padding
+    return version, sample_rate, channels, samples, length
+
+def _is_info_frame(data, pos, version, channels):
+    # The Xing/Info (LAME) or VBRI header frame carries no audio, and its
+    # frame count and gapless info would be wrong for the joined stream
+    if version == MPEG1:
+        side_info = 17 if channels == 1 else 32
+    else:
+        side_info = 9 if channels == 1 else 17
+    return data[pos + 4 + side_info:pos + 8 + side_info] in (b'Xing', b'Info') or data[pos + 36:pos + 40] == b'VBRI'
+
+class MP3Frames:
+    """
+    The audio frames of an MP3 stream, without tags and header frames.
+    """
+    __slots__ = ('data', 'sample_rate', 'channels', 'samples', 'frames')
+
+    def __init__(self, data):
+        """
+        Args:
+            data (bytes): The MP3 stream.
+
+        Raises:
+            ValueError: If the data is not a layer III stream, or holds no audio frames.
+        """
+        pos = _id3_size(data, 0)
+        start = None
+        self.sample_rate = self.channels = None
+        self.samples = self.frames = 0
+
+        while pos < len(data):
+            header = parse_header(data, pos)
+            if header is None:
+                # An ID3v1 tag at the end is fine, anything else is not an MP3 stream
+                if data[pos:pos + 3] == b'TAG' or _id3_size(data, pos):
+                    break
+                raise ValueError(f"no MP3 frame at byte {pos}")
+            version, sample_rate, channels, samples, length = header
+            if pos + length > len(data):
+                # Drop a truncated last frame
+                break
+
+            if start is None:
+                if _is_info_frame(data, pos, version, channels):
+                    pos += length
+                    continue
+                start = pos
+                self.sample_rate, self.channels = sample_rate, channels
+            elif (sample_rate, channels) != (self.sample_rate, self.channels):
+                raise ValueError(f"format changes at byte {pos}")
+
+            self.samples += samples
+            self.frames += 1
+            pos += length
+
+        if start is None:
+            raise ValueError("no MP3 audio frames")
+        self.data = memoryview(data)[start:pos]
+
+    @property
+    def duration(self):
+        """
+        Returns:
+            float: The length of the audio in seconds.
+        """
+        return self.samples / self.sample_rate
+
+def concat(streams):
+    """
+    Join MP3 streams without re-encoding.
+
+    Args:
+        streams (list): MP3Frames of the same sample rate and channel count.
+
+    Returns:
+        bytes: One MP3 stream.
+
+    Raises:
+        ValueError: If the streams differ in sample rate or channel count.
+    """
+    formats = {(stream.sample_rate, stream.channels) for stream in streams}
+    if len(formats) > 1:
+        raise ValueError(f"cannot join MP3 streams of different formats: {sorted(formats)}")
+    return b''.join(stream.data for stream in streams)
@@ -0,0 +1,67 @@
+"""
+16 kHz mono PCM sidecars of the generated audio.
+
+The audio stage already holds every post's MP3 in memory, so it can decode
+it once into the format whisper works on and store the samples next to the
+MP3. The subtitle stage then maps the samples from disk instead of spawning
+ffmpeg to decode and resample the MP3 again.
+"""
+import os
+import subprocess
+import threading
+
+from config.structure import AUDIO_DIR
+
+# The sample rate whisper transcribes at
+SAMPLE_RATE = 16000
+# The file name suffix of sidecars
+SUFFIX = '.pcm.npy'
+
+def sidecar_path(hash):
+    """
+    Returns:
+        str: The path of the PCM sidecar of a post's audio.
+    """
+    return os.path.join(AUDIO_DIR, f'{hash}{SUFFIX}')
+
+def decode(data, sample_rate=SAMPLE_RATE):
+    """
+    Decode audio to mono 16 bit PCM with a single ffmpeg call, fed from memory.
+
+    Args:
+        data (bytes): The encoded audio, e.g. an MP3.
+        sample_rate (int): The sample rate to resample to.
+
+    Returns:
+        numpy.ndarray: The int16 samples.
+    """
+    import numpy as np
+
+    cmd = ['ffmpeg', '-nostdin', '-loglevel', 'error', '-threads', '0', '-i', 'pipe:0',
+           '-f', 's16le', '-ac', '1', '-acodec', 'pcm_s16le', '-ar', str(sample_rate), 'pipe:1']
+    output = subprocess.run(cmd, input=bytes(data), capture_output=True, check=True).stdout
+    return np.frombuffer(output, np.int16)
+
+def save(path, samples):
+    """
+    Store int16 samples as an .npy file, atomically.
+    """
+    import numpy as np
+
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'wb') as file:
+        np.save(file, samples)
+    os.replace(tmp_path, path)
+
+def load(path):
+    """
+    Load a sidecar as whisper expects its input.
+
+    Returns:
+        numpy.ndarray: The float32 samples scaled to [-1, 1).
+    """
+    import numpy as np
+
+    # Memory-mapped, so only the conversion below allocates
+    samples = np.load(path, mmap_mode='r')
+    return samples.astype(np.float32) / 32768.0
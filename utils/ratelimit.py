@@ -0,0 +1,31 @@
+import threading
+import time
+
+class RateLimiter:
+    """
+    Spaces out calls per key (e.g. per host) to at most `rate` calls per second.
+
+    Thread-safe: concurrent callers for the same key reserve consecutive time
+    slots and each sleeps until its own slot.
+    """
+    def __init__(self, rate):
+        """
+        Args:
+            rate (float): The allowed calls per second per key, or 0 for no limit.
+        """
+        self.interval = 1 / rate if rate else 0
+        self._lock = threading.Lock()
+        self._next_slot = {}
+
+    def wait(self, key):
+        """
+        Block until the caller may make its next call for key.
+        """
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(key, now))
+            self._next_slot[key] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
@@ -0,0 +1,113 @@
+"""
+Subtitles from the known text of a post instead of speech recognition.
+
+The audio stage knows the text of every TTS chunk and, from its MP3 frames,
+exactly how long it is. It stores both in a small timings sidecar, from
+which the subtitle cues are laid out: each chunk's words are spread over the
+chunk's duration in proportion to their length, with a little extra time
+for the pause after punctuation.
+"""
+import json
+import os
+import threading
+
+from config.structure import AUDIO_DIR
+
+# Extra weight, in characters, of a word followed by a pause
+PAUSE_WEIGHT = 3
+SENTENCE_END = '.!?'
+PAUSE_END = SENTENCE_END + ',;:'
+
+def timings_path(hash):
+    """
+    Returns:
+        str: The path of the timings sidecar of a post's audio.
+    """
+    return os.path.join(AUDIO_DIR, f'{hash}.chunks.json')
+
+def save_timings(path, chunks):
+    """
+    Store the text and duration of every chunk of an audio, atomically.
+
+    Args:
+        chunks (list): (text, duration in seconds) tuples, in order.
+    """
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w') as file:
+        json.dump([[text, duration] for text, duration in chunks], file)
+    os.replace(tmp_path, path)
+
+def load_timings(path):
+    """
+    Returns:
+        list: The (text, duration) tuples of the chunks.
+    """
+    with open(path) as file:
+        return [(text, duration) for text, duration in json.load(file)]
+
+def align(chunks, max_chars=42):
+    """
+    Lay out subtitle cues over the chunks of an audio.
+
+    Cues end at the end of a sentence or chunk, or before they would grow beyond max_chars.
+
+    Args:
+        chunks (list): (text, duration in seconds) tuples, in order.
+        max_chars (int): The maximum length of a cue, unless a single word is longer.
+
+    Returns:
+        list: (start, end, text) tuples, with times in seconds.
+    """
+    cues = []
+    offset = 0.0
+    for text, duration in chunks:
+        words = text.split()
+        if not words:
+            offset += duration
+            continue
+
+        weights = [len(word) + 1 + (PAUSE_WEIGHT if word[-1] in PAUSE_END else 0) for word in words]
+        scale = duration / sum(weights)
+
+        cue, length, start, time = [], 0, offset, offset
+        for word, weight in zip(words, weights):
+            if cue and length + 1 + len(word) > max_chars:
+                cues.append((start, time, ' '.join(cue)))
+                cue, length, start = [], 0, time
+            cue.append(word)
+            length += len(word) + (1 if length else 0)
+            time += weight * scale
+            if word[-1] in SENTENCE_END:
+                cues.append((start, time, ' '.join(cue)))
+                cue, length, start = [], 0, time
+
+        offset += duration
+        if cue:
+            cues.append((start, offset, ' '.join(cue)))
+    return cues
+
+def format_timestamp(seconds):
+    """
+    Returns:
+        str: A time in SRT notation, e.g. 00:01:02,345.
+    """
+    milliseconds = round(seconds * 1000)
+    hours, milliseconds = divmod(milliseconds, 3_600_000)
+    minutes, milliseconds = divmod(milliseconds, 60_000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return f'{hours:02d}:{minutes:02d}:{seconds:02d},{milliseconds:03d}'
+
+def write_srt(path, cues):
+    """
+    Write cues as an SRT file, atomically.
+
+    Args:
+        cues (list): (start, end, text) tuples, with times in seconds.
+    """
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        for index, (start, end, text) in enumerate(cues, start=1):
+            # An arrow in the text would end the cue's timing line early
+            text = text.replace('-->', '->')
+            file.write(f'{index}\n{format_timestamp(start)} --> {format_timestamp(end)}\n{text}\n\n')
+    os.replace(tmp_path, path)
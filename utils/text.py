@@ -1,21 +1,88 @@
 import re #split_text_into_chunks
 
-def replace_words(text, replacement_dict):
+class TextNormalizer:
     """
-    Replaces words in the given text based on the provided replacement dictionary.
+    Cleans up Reddit text: replaces slang words, removes age/gender tags like
+    "(24m)" and collapses spaces, tabs and newlines.
+
+    The patterns are compiled once, with the whole slang table as a single
+    alternation, and each rule first checks with a cheap substring search
+    whether it can match at all, so a typical text is only scanned by fast
+    string methods and copied at most once per rule that applies. The
+    original casing is kept, and slang is only replaced as a whole word (so
+    'til' does not touch 'until').
+
+    Example:
+        >>> TextNormalizer({'til': 'Today I Learned'})("TIL  my (24M) uncle\\nwas right until now")
+        'Today I Learned my uncle was right until now'
+    """
+    _TAG_PATTERN = re.compile(r"\(?\d{1,3}[mfMF]\)?")
+    _SPACES_PATTERN = re.compile(r" {2,}")
+    _TABS_AND_NEWLINES = str.maketrans('\n\t', '  ')
+    _DIGITS = '0123456789'
+
+    def __init__(self, replacement_dict):
+        """
+        Args:
+            replacement_dict (dict): Slang words (matched case-insensitively) and their replacements.
+        """
+        self.replacements = {k.lower(): v for k, v in replacement_dict.items()}
+        # Longest first, so e.g. 'f*cked' wins over 'f*ck'
+        words = '|'.join(re.escape(k) for k in sorted(self.replacements, key=len, reverse=True))
+        # Matched against the lowercased text, which is much faster than re.IGNORECASE
+        self._slang_pattern = re.compile(rf"(?<!\w)(?:{words})(?!\w)") if words else None
+        self._slang_pattern_ignorecase = re.compile(self._slang_pattern.pattern, re.IGNORECASE) if words else None
+
+    def _replace_slang(self, text, lowered):
+        if len(lowered) != len(text):
+            # Some characters change length when lowercased, so positions would not line up
+            return self._slang_pattern_ignorecase.sub(lambda match: self.replacements[match.group(0).lower()], text)
+        parts = []
+        end = 0
+        for match in self._slang_pattern.finditer(lowered):
+            parts.append(text[end:match.start()])
+            parts.append(self.replacements[match.group(0)])
+            end = match.end()
+        if not parts:
+            return text
+        parts.append(text[end:])
+        return ''.join(parts)
+
+    def __call__(self, text):
+        """
+        Args:
+            text (str): The text to normalize.
+
+        Returns:
+            str: The normalized text.
+        """
+        if self._slang_pattern is not None:
+            lowered = text.lower()
+            if any(word in lowered for word in self.replacements):
+                text = self._replace_slang(text, lowered)
+
+        if any(digit in text for digit in self._DIGITS):
+            text = self._TAG_PATTERN.sub('', text)
+
+        if '\n' in text or '\t' in text:
+            text = text.translate(self._TABS_AND_NEWLINES)
+        if '  ' in text:
+            text = self._SPACES_PATTERN.sub(' ', text)
+        return text.strip()
+
+_WHITESPACE_PATTERN = re.compile(r"[ \n\t]+")
+
+def collapse_whitespace(text):
+    """
+    Replace every run of spaces, tabs and newlines with a single space and strip the ends.
 
     Args:
-        text (str): The input text to be processed.
-        replacement_dict (dict): A dictionary containing word replacements, where the keys are the words to be replaced
-                                and the values are the replacement words.
+        text (str): The input text.
 
     Returns:
-        str: The text with the specified words replaced.
-
+        str: The cleaned text.
     """
-    for k, v in replacement_dict.items():
-        text = text.lower().replace(k.lower(), v)
-    return text
+    return _WHITESPACE_PATTERN.sub(' ', text).strip()
 
 def split_text_into_chunks(text, max_chunk_length=300):
     """
@@ -4,7 +4,7 @@
 # version: 1.0
 # credits: https://github.com/oscie57/tiktok-voice
 
-import threading, requests, base64
+import threading
 # from playsound import playsound
 
 VOICES = [
@@ -65,7 +65,8 @@ VOICES = [
 ]
 
 ENDPOINTS = ['https://tiktok-tts.weilnet.workers.dev/api/generation', "https://tiktoktts.com/api/tiktok-tts"]
-current_endpoint = 0
+# bump when a change to the requests or their decoding changes the returned audio, invalidating cached chunks
+PROTOCOL_VERSION = 1
 # in one conversion, the text can have a maximum length of 300 characters
 TEXT_BYTE_LIMIT = 300
 
@@ -85,111 +86,25 @@ def split_string(string: str, chunk_size: int) -> list[str]:
         result.append(current_chunk.strip())
     return result
 
-# checking if the website that provides the service is available
-def get_api_response() -> requests.Response:
-    url = f'{ENDPOINTS[current_endpoint].split("/a")[0]}'
-    response = requests.get(url)
-    return response
-
-# saving the audio file
-def save_audio_file(base64_data: str, filename: str = "output.mp3") -> None:
-    audio_bytes = base64.b64decode(base64_data)
-    with open(filename, "wb") as file:
-        file.write(audio_bytes)
-
-# send POST request to get the audio data
-def generate_audio(text: str, voice: str) -> bytes:
-    url = f'{ENDPOINTS[current_endpoint]}'
-    headers = {'Content-Type': 'application/json'}
-    data = {'text': text, 'voice': voice}
-    response = requests.post(url, headers=headers, json=data)
-    return response.content
+_default_client = None
+_default_client_lock = threading.Lock()
 
 # creates an text to speech audio file
 def tts(text: str, voice: str = "none", filename: str = "output.mp3", play_sound: bool = False) -> None:
-    # checking if the website is available
-    global current_endpoint
+    # Requests go through a shared TTSClient, which pools connections and tracks endpoint health,
+    # instead of probing an endpoint before every request
+    global _default_client
+    from utils.tts_client import TTSClient
 
-    if get_api_response().status_code == 200:
-        #print("Service available!")
-        pass
-    else:
-        current_endpoint = (current_endpoint + 1) % 2
-        if get_api_response().status_code == 200:
-            # print("Service available!")
-            pass
-        else:
-            #print(f"Service not available and probably temporarily rate limited, try again later...")
-            return
-    
-    # checking if arguments are valid
-    if voice == "none":
-        #print("No voice has been selected")
-        pass
-        return
-    
-    if not voice in VOICES:
-        #print("Voice does not exist")
-        pass
-        return
-
-    if len(text) == 0:
-        #print("Insert a valid text")
-        pass
-        return
+    with _default_client_lock:
+        if _default_client is None or [endpoint.url for endpoint in _default_client.endpoints] != ENDPOINTS:
+            if _default_client is not None:
+                _default_client.close()
+            _default_client = TTSClient(list(ENDPOINTS))
+        client = _default_client
 
-    # creating the audio file
-    try:
-        if len(text) < TEXT_BYTE_LIMIT:
-            audio = generate_audio((text), voice)
-            if current_endpoint == 0:
-                audio_base64_data = str(audio).split('"')[5]
-            else:
-                audio_base64_data = str(audio).split('"')[3].split(",")[1]
-            
-            if audio_base64_data == "error":
-                #print("This voice is unavailable right now")
-                pass
-                return
-                
-        else:
-            # Split longer text into smaller parts
-            text_parts = split_string(text, 299)
-            audio_base64_data = [None] * len(text_parts)
-            
-            # Define a thread function to generate audio for each text part
-            def generate_audio_thread(text_part, index):
-                audio = generate_audio(text_part, voice)
-                if current_endpoint == 0:
-                    base64_data = str(audio).split('"')[5]
-                else:
-                    base64_data = str(audio).split('"')[3].split(",")[1]
+    # creating the audio file; raises ValueError for an invalid voice or text and TTSError if no endpoint could synthesize it
+    audio = client.synthesize(text, voice)
 
-                if audio_base64_data == "error":
-                    #print("This voice is unavailable right now")
-                    pass
-                    return "error"
-            
-                audio_base64_data[index] = base64_data
-
-            threads = []
-            for index, text_part in enumerate(text_parts):
-                # Create and start a new thread for each text part
-                thread = threading.Thread(target=generate_audio_thread, args=(text_part, index))
-                thread.start()
-                threads.append(thread)
-
-            # Wait for all threads to complete
-            for thread in threads:
-                thread.join()
-
-            # Concatenate the base64 data in the correct order
-            audio_base64_data = "".join(audio_base64_data)
-            
-        save_audio_file(audio_base64_data, filename)
-        #print(f"Audio file saved successfully as '{filename}'")
-        pass
-
-    except Exception as e:
-        #print("Error occurred while generating audio:", str(e))
-        pass
+    with open(filename, "wb") as file:
+        file.write(audio)
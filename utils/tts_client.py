@@ -0,0 +1,342 @@
+import base64
+import binascii
+import concurrent.futures
+import logging
+import threading
+import time
+
+from collections import deque
+
+import requests
+
+from requests.adapters import HTTPAdapter
+
+from utils import tiktok_tts
+from utils.logger import setup_logger
+from utils.metrics import metrics
+
+# Circuit breaker states
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+class TTSError(Exception):
+    """Raised when no TTS endpoint could synthesize a text."""
+
+class TTSUnavailable(TTSError):
+    """Raised when the circuits of all TTS endpoints are open, so the failure says nothing about the text."""
+
+class Endpoint:
+    """
+    One TTS endpoint with its own keep-alive connection pool and circuit breaker.
+    """
+    def __init__(self, url, pool_size):
+        self.url = url
+        self.root = url.split('/a')[0]
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self.state = CLOSED
+        self.failures = 0
+        self.backoff = 0.0
+        self.retry_at = 0.0
+
+class TTSClient:
+    """
+    A thread-safe client for the TikTok TTS endpoints in utils/tiktok_tts.py.
+
+    Requests go to the first endpoint whose circuit is closed, without probing
+    it first. After failure_threshold consecutive failures (or one rate limit
+    response) an endpoint's circuit opens and callers move on to the next one.
+    A background thread probes open endpoints with exponential backoff and
+    lets requests through again once a probe succeeds; the first successful
+    request then closes the circuit.
+
+    With hedging enabled, a request still unanswered after a high quantile of
+    recent latencies is duplicated to the next healthy endpoint and whichever
+    answer comes first is used, so a single slow response does not hold up a
+    whole post. A budget caps the share of extra requests.
+    """
+    def __init__(self, endpoints=None, pool_size=16, timeout=30, failure_threshold=3,
+                 min_backoff=5.0, max_backoff=300.0, hedge_quantile=None, hedge_budget=0.1, on_rate_limit=None, loglevel = logging.INFO):
+        """
+        Args:
+            endpoints (list, optional): The generation URLs, in order of preference. Defaults to tiktok_tts.ENDPOINTS.
+            pool_size (int): The number of keep-alive connections per endpoint.
+            timeout (float): Seconds to wait for an endpoint to answer.
+            failure_threshold (int): Consecutive failures after which an endpoint's circuit opens.
+            min_backoff (float): Seconds before an open endpoint is probed for the first time.
+            max_backoff (float): The longest time between two probes.
+            hedge_quantile (float, optional): Enables hedging: once a request takes longer than this quantile
+                                              of recent latencies, the same request is also sent to the next endpoint.
+            hedge_budget (float): The maximum number of hedges as a share of all requests.
+            on_rate_limit (callable, optional): Called without arguments on every rate limit response,
+                                                e.g. ConcurrencyController.report_rate_limit.
+        """
+        self.logger = setup_logger(__name__, loglevel, emoji='📡')
+        self.endpoints = [Endpoint(url, pool_size) for url in (endpoints or tiktok_tts.ENDPOINTS)]
+        self.timeout = timeout
+        self.failure_threshold = failure_threshold
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+
+        self.hedge_quantile = hedge_quantile
+        self.hedge_budget = hedge_budget
+        self.hedge_min_samples = 20
+        self.on_rate_limit = on_rate_limit
+
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=200)
+        self._hedgeable = 0
+        self._hedges = 0
+        self._hedge_wins = 0
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=pool_size * 2, thread_name_prefix='tts') if hedge_quantile is not None else None
+        self._wake = threading.Event()
+        self._closed = False
+        self._monitor = threading.Thread(target=self._monitor_loop, name='tts-health', daemon=True)
+        self._monitor.start()
+
+        for index, endpoint in enumerate(self.endpoints):
+            metrics.set_gauge('tts_endpoint_up', 1, endpoint=index)
+
+    def close(self):
+        """Stop the health monitor and close all connections."""
+        self._closed = True
+        self._wake.set()
+        if self._executor:
+            self._executor.shutdown(wait=False)
+        for endpoint in self.endpoints:
+            endpoint.session.close()
+
+    def _available(self):
+        with self._lock:
+            return [(index, endpoint) for index, endpoint in enumerate(self.endpoints) if endpoint.state != OPEN]
+
+    def _record_success(self, index, endpoint):
+        with self._lock:
+            if endpoint.state != CLOSED:
+                self.logger.info(f"TTS endpoint {index} recovered")
+            endpoint.state = CLOSED
+            endpoint.failures = 0
+            endpoint.backoff = 0.0
+        metrics.set_gauge('tts_endpoint_up', 1, endpoint=index)
+
+    def _record_failure(self, index, endpoint, reason, rate_limited=False):
+        with self._lock:
+            endpoint.failures += 1
+            if endpoint.state == CLOSED and endpoint.failures < self.failure_threshold and not rate_limited:
+                return
+            if endpoint.state != OPEN:
+                endpoint.backoff = min(max(endpoint.backoff * 2, self.min_backoff), self.max_backoff)
+                endpoint.retry_at = time.monotonic() + endpoint.backoff
+                endpoint.state = OPEN
+                self.logger.warning(f"TTS endpoint {index} unavailable ({reason}), retrying in {endpoint.backoff:.1f}s")
+        metrics.set_gauge('tts_endpoint_up', 0, endpoint=index)
+        self._wake.set()
+
+    def _monitor_loop(self):
+        while not self._closed:
+            with self._lock:
+                now = time.monotonic()
+                due = [(index, endpoint) for index, endpoint in enumerate(self.endpoints) if endpoint.state == OPEN and endpoint.retry_at <= now]
+
+            for index, endpoint in due:
+                try:
+                    healthy = endpoint.session.get(endpoint.root, timeout=self.timeout).status_code == 200
+                except requests.RequestException:
+                    healthy = False
+                with self._lock:
+                    if healthy:
+                        # Let requests through; the next success closes the circuit, a failure opens it again
+                        endpoint.state = HALF_OPEN
+                        endpoint.failures = 0
+                    else:
+                        endpoint.backoff = min(endpoint.backoff * 2, self.max_backoff)
+                        endpoint.retry_at = time.monotonic() + endpoint.backoff
+                if healthy:
+                    self.logger.debug(f"TTS endpoint {index} answered a probe, letting requests through")
+                    metrics.set_gauge('tts_endpoint_up', 1, endpoint=index)
+
+            # Sleep until the next probe is due, or until another circuit opens
+            with self._lock:
+                now = time.monotonic()
+                waits = [max(endpoint.retry_at - now, 0) for endpoint in self.endpoints if endpoint.state == OPEN]
+            self._wake.wait(min(waits) if waits else None)
+            self._wake.clear()
+
+    @staticmethod
+    def _decode(response):
+        """
+        Extract the audio from a generation response, in either of the endpoints' formats.
+
+        Raises:
+            ValueError: If the response holds no audio.
+        """
+        data = response.json().get('data')
+        if not data or data == 'error':
+            raise ValueError(f"no audio in response: {response.text[:100]}")
+        if data.startswith('data:'):
+            data = data.split(',', 1)[1]
+        try:
+            return base64.b64decode(data, validate=True)
+        except binascii.Error as e:
+            raise ValueError(f"invalid base64 audio: {e}")
+
+    def _request(self, index, endpoint, text, voice):
+        """
+        Send one generation request and record its outcome in the endpoint's circuit breaker.
+
+        Raises:
+            TTSError: If the request failed.
+        """
+        start = time.perf_counter()
+        try:
+            with metrics.timer('tts_request_seconds', endpoint=index):
+                response = endpoint.session.post(endpoint.url, json={'text': text, 'voice': voice}, timeout=self.timeout)
+            if response.status_code == 429:
+                self._record_failure(index, endpoint, 'rate limited', rate_limited=True)
+                if self.on_rate_limit:
+                    self.on_rate_limit()
+                raise TTSError(f"endpoint {index}: HTTP 429 rate limited")
+            response.raise_for_status()
+            audio = self._decode(response)
+        except (requests.RequestException, ValueError) as e:
+            self._record_failure(index, endpoint, type(e).__name__)
+            raise TTSError(f"endpoint {index}: {e}")
+
+        self._record_success(index, endpoint)
+        with self._lock:
+            self._latencies.append(time.perf_counter() - start)
+        return audio
+
+    def _hedge_delay(self):
+        """
+        Returns:
+            float: How long to wait for a request before hedging it, or None if there are too few samples yet.
+        """
+        with self._lock:
+            if len(self._latencies) < self.hedge_min_samples:
+                return None
+            samples = sorted(self._latencies)
+        return samples[min(int(len(samples) * self.hedge_quantile), len(samples) - 1)]
+
+    def _take_hedge(self):
+        # Hedges may add at most hedge_budget extra requests on top of the regular ones
+        with self._lock:
+            if self._hedges >= self.hedge_budget * self._hedgeable:
+                return False
+            self._hedges += 1
+            return True
+
+    def _hedged(self, primary, alternate, text, voice):
+        """
+        Request from the primary endpoint, and also from the alternate one if the
+        primary is slower than the hedge delay. Returns whichever answers first.
+
+        Raises:
+            TTSError: If both endpoints failed.
+        """
+        with self._lock:
+            self._hedgeable += 1
+        errors = []
+        future = self._executor.submit(self._request, *primary, text, voice)
+        delay = self._hedge_delay()
+        try:
+            return future.result(timeout=delay)
+        except concurrent.futures.TimeoutError:
+            pass
+        except TTSError as e:
+            # Failed before the hedge was due, so this is a plain failover
+            errors.append(str(e))
+            future = None
+
+        if future is not None and not self._take_hedge():
+            try:
+                return future.result()
+            except TTSError as e:
+                errors.append(str(e))
+                future = None
+
+        if future is None:
+            try:
+                return self._request(*alternate, text, voice)
+            except TTSError as e:
+                raise TTSError('; '.join(errors + [str(e)]))
+
+        hedge = self._executor.submit(self._request, *alternate, text, voice)
+        for done in concurrent.futures.as_completed((future, hedge)):
+            try:
+                audio = done.result()
+            except TTSError as e:
+                errors.append(str(e))
+                continue
+            won = done is hedge
+            with self._lock:
+                self._hedge_wins += won
+            metrics.inc('tts_hedges_total', result='won' if won else 'lost')
+            return audio
+        metrics.inc('tts_hedges_total', result='failed')
+        raise TTSError('; '.join(errors))
+
+    def _generate(self, text, voice):
+        endpoints = self._available()
+        errors = []
+        if self.hedge_quantile is not None and len(endpoints) > 1:
+            try:
+                return self._hedged(endpoints[0], endpoints[1], text, voice)
+            except TTSError as e:
+                errors.append(str(e))
+                endpoints = endpoints[2:]
+
+        for index, endpoint in endpoints:
+            try:
+                return self._request(index, endpoint, text, voice)
+            except TTSError as e:
+                errors.append(str(e))
+
+        if not self._available():
+            raise TTSUnavailable('; '.join(errors) or "all TTS endpoints are unavailable")
+        raise TTSError('; '.join(errors))
+
+    def hedge_stats(self):
+        """
+        Returns:
+            dict: The number of hedgeable requests, hedges sent, hedges which answered first, their win rate and the current hedge delay.
+        """
+        delay = self._hedge_delay() if self.hedge_quantile is not None else None
+        with self._lock:
+            return {
+                'requests': self._hedgeable,
+                'hedges': self._hedges,
+                'wins': self._hedge_wins,
+                'win_rate': self._hedge_wins / self._hedges if self._hedges else 0.0,
+                'delay': delay,
+            }
+
+    def synthesize(self, text, voice):
+        """
+        Synthesize a text.
+
+        Args:
+            text (str): The text; texts longer than the endpoint limit are split at word boundaries.
+            voice (str): One of tiktok_tts.VOICES.
+
+        Returns:
+            bytes: The MP3 audio.
+
+        Raises:
+            ValueError: If the voice or text is invalid.
+            TTSUnavailable: If all endpoints are unavailable.
+            TTSError: If no endpoint could synthesize the text.
+        """
+        if voice not in tiktok_tts.VOICES:
+            raise ValueError(f"Unknown voice {voice}")
+        if not text.strip():
+            raise ValueError("Empty text")
+
+        if len(text) < tiktok_tts.TEXT_BYTE_LIMIT:
+            return self._generate(text, voice)
+        # MP3 frames can simply be concatenated
+        return b''.join(self._generate(part, voice) for part in tiktok_tts.split_string(text, tiktok_tts.TEXT_BYTE_LIMIT - 1))
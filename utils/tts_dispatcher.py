@@ -0,0 +1,93 @@
+import asyncio
+import concurrent.futures
+import logging
+import threading
+
+from utils.logger import setup_logger
+from utils.metrics import metrics
+
+class TTSDispatcher:
+    """
+    Multiplexes the TTS chunk requests of all posts in flight onto one global
+    concurrency and rate limit.
+
+    An asyncio event loop in a background thread queues every submitted chunk
+    and starts it once a slot is free and the rate limit allows. The requests
+    themselves run through a TTSClient on a thread pool of exactly
+    `concurrency` threads, so the number of threads stays fixed no matter how
+    many posts and chunks are waiting. Callers get a Future per chunk and can
+    reassemble a post in order as its chunks complete.
+    """
+    def __init__(self, client, concurrency=16, rate=0.0, loglevel = logging.INFO):
+        """
+        Args:
+            client (TTSClient): The client sending the requests.
+            concurrency (int): The maximum number of requests in flight across all posts.
+            rate (float): The maximum number of requests started per second, or 0 for no limit.
+        """
+        self.logger = setup_logger(__name__, loglevel, emoji='🔀')
+        self.client = client
+        self.concurrency = max(1, concurrency)
+        self.rate = rate
+
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='tts-request')
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='tts-dispatcher', daemon=True)
+        self._thread.start()
+
+        # Only touched from the event loop thread
+        self._semaphore = None
+        self._next_start = 0.0
+        self._queued = 0
+        self._in_flight = 0
+
+    async def _wait_for_rate(self):
+        if not self.rate:
+            return
+        now = self._loop.time()
+        start = max(now, self._next_start)
+        self._next_start = start + 1 / self.rate
+        await asyncio.sleep(start - now)
+
+    async def _dispatch(self, text, voice):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+
+        self._queued += 1
+        metrics.set_gauge('tts_queued', self._queued)
+        started = False
+        try:
+            async with self._semaphore:
+                await self._wait_for_rate()
+                started = True
+                self._queued -= 1
+                self._in_flight += 1
+                metrics.set_gauge('tts_queued', self._queued)
+                metrics.set_gauge('tts_in_flight', self._in_flight)
+                try:
+                    return await self._loop.run_in_executor(self._executor, self.client.synthesize, text, voice)
+                finally:
+                    self._in_flight -= 1
+                    metrics.set_gauge('tts_in_flight', self._in_flight)
+        finally:
+            # Cancelled while still waiting for a slot
+            if not started:
+                self._queued -= 1
+                metrics.set_gauge('tts_queued', self._queued)
+
+    def submit(self, text, voice):
+        """
+        Queue a chunk for synthesis.
+
+        Returns:
+            concurrent.futures.Future: Resolves to the MP3 bytes, or raises the TTSClient's error.
+                                       Cancelling it drops the chunk if it has not started yet.
+        """
+        return asyncio.run_coroutine_threadsafe(self._dispatch(text, voice), self._loop)
+
+    def close(self):
+        """Stop the event loop, the request threads and the client."""
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._executor.shutdown(wait=False)
+        self.client.close()